@@ -0,0 +1,319 @@
+# bench_mcp.py - MCP 服务压测：驱动真实请求链路（本地桩服务代替上游），按工具统计延迟分位与吞吐
+# 支持 stdio（每个客户端一个进程）与 http（所有客户端共用一个进程）两种传输，便于对比
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import threading
+import subprocess
+import http.client
+from datetime import datetime, timedelta
+from stub_upstream import start_stub
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def percentile(values: list, pct: float) -> float:
+    """最近秩法计算分位数"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, int(round(pct / 100 * len(ordered) + 0.5)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+class StdioClient:
+    """JSON-RPC stdio 客户端：请求可并发在途，后台线程按 id 匹配响应并记录耗时"""
+    def __init__(self, env: dict, cwd: str):
+        self.proc = subprocess.Popen(
+            [sys.executable, "-m", "mcp_core"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            encoding="utf-8",
+            bufsize=1,
+            env=env,
+            cwd=cwd,
+        )
+        self._next_id = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        threading.Thread(target=self._read_loop, daemon=True).start()
+
+    def _read_loop(self):
+        for line in self.proc.stdout:
+            try:
+                message = json.loads(line)
+            except ValueError:
+                continue
+            if "id" not in message:
+                continue
+            with self._lock:
+                waiter = self._pending.pop(message["id"], None)
+            if waiter is not None:
+                waiter["response"] = message
+                waiter["elapsed"] = time.perf_counter() - waiter["sent"]
+                waiter["event"].set()
+
+    def call(self, method: str, params: dict = None, timeout: float = 60):
+        with self._lock:
+            self._next_id += 1
+            message_id = self._next_id
+            waiter = {"event": threading.Event(), "response": None, "elapsed": None}
+            self._pending[message_id] = waiter
+        line = json.dumps({"jsonrpc": "2.0", "id": message_id, "method": method, "params": params or {}}, ensure_ascii=False)
+        waiter["sent"] = time.perf_counter()
+        with self._write_lock:
+            self.proc.stdin.write(line + "\n")
+            self.proc.stdin.flush()
+        if not waiter["event"].wait(timeout):
+            return None, timeout
+        return waiter["response"], waiter["elapsed"]
+
+    def close(self):
+        try:
+            self.proc.stdin.close()
+            self.proc.wait(timeout=10)
+        except Exception:
+            self.proc.kill()
+
+
+class HttpClient:
+    """Streamable HTTP 客户端：一个 MCP 会话，调用之间复用空闲的 keep-alive 连接"""
+    def __init__(self, host: str, port: int, path: str = "/mcp"):
+        self.host = host
+        self.port = port
+        self.path = path
+        self.session_id = None
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._idle = []
+
+    def call(self, method: str, params: dict = None, timeout: float = 60):
+        with self._lock:
+            self._next_id += 1
+            message_id = self._next_id
+        body = json.dumps({"jsonrpc": "2.0", "id": message_id, "method": method, "params": params or {}}, ensure_ascii=False)
+        headers = {"Content-Type": "application/json", "Accept": "application/json, text/event-stream"}
+        if self.session_id:
+            headers["Mcp-Session-Id"] = self.session_id
+        with self._lock:
+            connection = self._idle.pop() if self._idle else None
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=timeout)
+        started = time.perf_counter()
+        try:
+            connection.request("POST", self.path, body.encode("utf-8"), headers)
+            reply = connection.getresponse()
+            data = reply.read()
+        except (OSError, http.client.HTTPException):
+            connection.close()
+            return None, time.perf_counter() - started
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            self._idle.append(connection)
+        if method == "initialize":
+            self.session_id = reply.getheader("Mcp-Session-Id")
+        return (json.loads(data) if data else None), elapsed
+
+    def close(self):
+        with self._lock:
+            for connection in self._idle:
+                connection.close()
+            self._idle = []
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_http_server(env: dict, cwd: str):
+    """启动 HTTP 传输的 MCP 进程并等待端口就绪"""
+    port = _free_port()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "mcp_core", "--http", f"127.0.0.1:{port}"],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        env=env,
+        cwd=cwd,
+    )
+    deadline = time.monotonic() + 15
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return proc, port
+        except OSError:
+            time.sleep(0.05)
+    proc.kill()
+    raise RuntimeError("MCP HTTP 服务启动超时")
+
+
+def build_workload(tools: list, total: int, last_date: str, rows: int) -> list:
+    """按工具轮转生成请求；提报类工具使用互不重复的日期，避免被本地台账直接跳过"""
+    last = datetime.strptime(last_date, "%Y-%m-%d")
+    submit_day = 0
+    calls = []
+    for index in range(total):
+        tool = tools[index % len(tools)]
+        if tool == "tools/list":
+            calls.append((tool, "tools/list", {}))
+            continue
+        if tool == "daily.get":
+            date = (last - timedelta(days=index % max(rows, 1))).strftime("%Y-%m-%d")
+        else:
+            date = (last - timedelta(days=submit_day)).strftime("%Y-%m-%d")
+            submit_day += 1
+        calls.append((tool, "tools/call", {"name": tool, "arguments": {"date": date}}))
+    return calls
+
+
+def classify(response) -> str:
+    if response is None:
+        return "timeout"
+    if "error" in response:
+        return "error"
+    try:
+        text = response["result"]["content"][0]["text"]
+        return json.loads(text).get("task_status") or "ok"
+    except Exception:
+        return "ok"
+
+
+def run_benchmark(args) -> dict:
+    stub, base_url = start_stub(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        error_rate=args.error_rate,
+        rows=args.rows,
+        last_date=args.last_date,
+        seed=args.seed,
+    )
+    work_dir = tempfile.mkdtemp(prefix="jabanmcp-bench-")
+    env = os.environ.copy()
+    env.update({
+        "OVERTIME_API_URL": base_url,
+        "OVERTIME_API_TOKEN": env.get("OVERTIME_API_TOKEN", "bench"),
+        "MCP_SIMULATE": "0",
+        "MCP_LEDGER_FILE": os.path.join(work_dir, "ledger.db"),
+        "MCP_LOG_LEVEL": env.get("MCP_LOG_LEVEL", "WARNING"),
+        "PYTHONPATH": ROOT_DIR + os.pathsep + env.get("PYTHONPATH", ""),
+    })
+    # stdio：每个客户端各起一个进程（IDE / Agent 会话的现状）；http：所有客户端共用一个进程
+    server_proc = None
+    if args.transport == "http":
+        server_proc, port = start_http_server(env, work_dir)
+        clients = [HttpClient("127.0.0.1", port) for _ in range(args.clients)]
+    else:
+        clients = [StdioClient(env, work_dir) for _ in range(args.clients)]
+    for client in clients:
+        client.call("initialize", {"protocolVersion": "2025-06-18", "capabilities": {}})
+
+    calls = build_workload(args.tools, args.requests, args.last_date, args.rows)
+    stats = {}
+    stats_lock = threading.Lock()
+    slots = threading.Semaphore(args.concurrency)
+    workers = []
+
+    def run_one(client, tool, method, params):
+        try:
+            response, elapsed = client.call(method, params, timeout=args.timeout)
+            outcome = classify(response)
+            with stats_lock:
+                entry = stats.setdefault(tool, {"latencies": [], "outcomes": {}})
+                entry["latencies"].append(elapsed * 1000)
+                entry["outcomes"][outcome] = entry["outcomes"].get(outcome, 0) + 1
+        finally:
+            slots.release()
+
+    started = time.perf_counter()
+    for index, (tool, method, params) in enumerate(calls):
+        slots.acquire()
+        client = clients[index % len(clients)]
+        worker = threading.Thread(target=run_one, args=(client, tool, method, params), daemon=True)
+        worker.start()
+        workers.append(worker)
+    for worker in workers:
+        worker.join()
+    wall = time.perf_counter() - started
+    for client in clients:
+        client.close()
+    if server_proc is not None:
+        server_proc.terminate()
+        server_proc.wait(timeout=10)
+    stub.shutdown()
+
+    report = {
+        "transport": args.transport,
+        "clients": args.clients,
+        "server_processes": 1 if args.transport == "http" else args.clients,
+        "requests": args.requests,
+        "concurrency": args.concurrency,
+        "wall_seconds": round(wall, 3),
+        "throughput_rps": round(args.requests / wall, 2) if wall else None,
+        "upstream_calls": dict(stub.state.counters),
+        "upstream_connections": len(stub.state.connections),
+        "tools": {},
+    }
+    for tool, entry in sorted(stats.items()):
+        latencies = entry["latencies"]
+        report["tools"][tool] = {
+            "count": len(latencies),
+            "outcomes": entry["outcomes"],
+            "p50_ms": round(percentile(latencies, 50), 2),
+            "p95_ms": round(percentile(latencies, 95), 2),
+            "p99_ms": round(percentile(latencies, 99), 2),
+            "max_ms": round(max(latencies), 2),
+            "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        }
+    return report
+
+
+def print_report(report: dict):
+    print(
+        f"传输 {report['transport']}，客户端 {report['clients']}，服务进程 {report['server_processes']}；"
+        f"总请求 {report['requests']}，并发 {report['concurrency']}，耗时 {report['wall_seconds']} s，吞吐 {report['throughput_rps']} req/s"
+    )
+    print(f"上游调用 {report['upstream_calls']}，上游连接数 {report['upstream_connections']}")
+    print(f"{'tool':<18}{'count':>7}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}{'max(ms)':>10}{'rps':>9}  outcomes")
+    for tool, row in report["tools"].items():
+        print(
+            f"{tool:<18}{row['count']:>7}{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}"
+            f"{row['max_ms']:>10}{row['throughput_rps']:>9}  {row['outcomes']}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="MCP 服务延迟压测（本地桩服务代替上游 OA）")
+    parser.add_argument("--transport", choices=("stdio", "http"), default="stdio", help="stdio：每个客户端一个进程；http：所有客户端共用一个进程")
+    parser.add_argument("--clients", type=int, default=1, help="模拟的 MCP 客户端（IDE / Agent 会话）数")
+    parser.add_argument("--requests", type=int, default=200, help="总请求数")
+    parser.add_argument("--concurrency", type=int, default=8, help="同时在途的请求数")
+    parser.add_argument("--tools", default="daily.get,overtime.auto,tools/list", help="逗号分隔的工具轮转列表")
+    parser.add_argument("--latency-ms", type=float, default=20, help="桩服务每个请求的基础延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=5, help="桩服务延迟抖动（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="桩服务返回 500 的概率（0~1）")
+    parser.add_argument("--rows", type=int, default=365, help="桩服务日报行数")
+    parser.add_argument("--last-date", default="2025-12-31", help="桩服务最新日报日期")
+    parser.add_argument("--timeout", type=float, default=60, help="单个请求的等待超时（秒）")
+    parser.add_argument("--seed", type=int, default=7, help="桩服务随机种子，保证多次压测可比")
+    parser.add_argument("--json", action="store_true", help="以 JSON 输出报告")
+    args = parser.parse_args()
+    args.tools = [t.strip() for t in args.tools.split(",") if t.strip()]
+
+    report = run_benchmark(args)
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        print_report(report)
+
+
+if __name__ == "__main__":
+    main()
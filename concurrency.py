@@ -0,0 +1,55 @@
+# concurrency.py - 在途请求合并（single-flight）：相同键的并发调用只执行一次，其余调用等待并共享结果
+import threading
+
+
+class _Call:
+    """一次在途调用：完成后 event 置位，结果或异常供所有等待者读取"""
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    在途请求合并：同一个键同时只有一个调用真正执行（leader），
+    执行期间到达的相同调用直接等待 leader 的结果；调用结束后键即释放，不做结果缓存
+    """
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, key, func, timeout: float = None):
+        """
+        执行或加入 key 对应的在途调用
+        :param timeout: 加入在途调用时最多等待的秒数，None 表示一直等待
+        :return: (结果, shared)，shared 为 True 表示本次调用加入了其他调用方发起的在途调用
+        :raises TimeoutError: 等待在途调用超时；leader 抛出的异常会原样抛给所有等待者
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            if not call.event.wait(timeout):
+                raise TimeoutError("等待相同的在途请求超时")
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.event.set()
+        return call.result, False
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return len(self._calls)
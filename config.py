@@ -1,13 +1,35 @@
 # config.py - MCP 全局配置类，统一维护所有参数，便于扩展
 import os
+import sys
+import site
+import importlib.util
 try:
-    from dotenv import load_dotenv
+    from dotenv import load_dotenv, dotenv_values
 except Exception:
     def load_dotenv(*args, **kwargs):
         return None
 
-# 加载.env配置，MCP 启动时先加载全局配置
-load_dotenv()
+    def dotenv_values(*args, **kwargs):
+        return {}
+
+# 加载.env配置，MCP 启动时先加载全局配置（MCP_ENV_FILE 可指定其他文件）
+load_dotenv(os.getenv("MCP_ENV_FILE") or None)
+# 各 env 文件上次读取到的内容，热更新时只把文件里真正改动过的项写入环境变量
+_ENV_SNAPSHOTS = {}
+_STARTUP_ENV_FILE = os.getenv("MCP_ENV_FILE", ".env")
+if os.path.exists(_STARTUP_ENV_FILE):
+    _ENV_SNAPSHOTS[_STARTUP_ENV_FILE] = dotenv_values(_STARTUP_ENV_FILE)
+
+def _default_calendar_file() -> str:
+    """节假日数据文件的默认位置：源码目录运行时在模块旁，pip 安装后在 <prefix>/share/jabanmcp"""
+    local = os.path.join(os.path.dirname(os.path.abspath(__file__)), "holidays.json")
+    if os.path.exists(local):
+        return local
+    for prefix in (sys.prefix, site.getuserbase()):
+        installed = os.path.join(prefix, "share", "jabanmcp", "holidays.json")
+        if os.path.exists(installed):
+            return installed
+    return local
 
 class MCPGlobalConfig:
     """MCP 主控程序全局配置"""
@@ -17,8 +39,74 @@ class MCPGlobalConfig:
     DAILY_TEMPLATE_ID = os.getenv("DAILY_TEMPLATE_ID", "1876523888959934464")
     PROJECT_NAME = os.getenv("PROJECT_NAME", "中合茂力新能源电站智能监控管理平台---（河北张家口生产管理系统）")
     PROJECT_ID = os.getenv("PROJECT_ID", "XM-XS-20230803")
+    # 提报人身份与流程定义（默认租户使用；多用户时在租户档案中按人配置）
+    USER_ID = os.getenv("OVERTIME_USER_ID", "1044")
+    EMPLOYEE_NAME = os.getenv("OVERTIME_EMPLOYEE_NAME", "马军")
+    DEPT_ID = os.getenv("OVERTIME_DEPT_ID", "1875170026625798144")
+    DEPT_NAME = os.getenv("OVERTIME_DEPT_NAME", "研发部")
+    FLOW_DEF_ID = os.getenv("OVERTIME_FLOW_DEF_ID", "1882365832407658496")
+    TENANTS_FILE = os.getenv("MCP_TENANTS_FILE")  # 多用户档案文件（JSON），不配置时只有默认租户
+    # 热更新：监视 ENV_FILE 与 TENANTS_FILE，变化或令牌过期时重新读取配置，无需重启进程
+    ENV_FILE = os.getenv("MCP_ENV_FILE", ".env")
+    HOT_RELOAD = os.getenv("MCP_HOT_RELOAD", "1")
     REQUEST_TIMEOUT = int(os.getenv("MCP_TIMEOUT", 30))
     SIMULATE = os.getenv("MCP_SIMULATE", "0")
+    # 上游传输后端：live 真实接口；fake 进程内仿真（MCP_SIMULATE=1 等价于 fake）；
+    # record 真实调用并录制到 CASSETTE_FILE；replay 只从 CASSETTE_FILE 回放，不访问网络
+    UPSTREAM = os.getenv("MCP_UPSTREAM", "live")
+
+    # 上游连接池配置（长连接复用，避免每次调用都重新握手）
+    POOL_SIZE = int(os.getenv("MCP_POOL_SIZE", 4))
+    POOL_BLOCK = os.getenv("MCP_POOL_BLOCK", "1")
+    HTTP_KEEP_ALIVE = os.getenv("MCP_HTTP_KEEP_ALIVE", "1")
+    CONNECT_TIMEOUT = float(os.getenv("MCP_CONNECT_TIMEOUT", 5))
+    READ_TIMEOUT = float(os.getenv("MCP_READ_TIMEOUT", REQUEST_TIMEOUT))
+
+    # 上游韧性配置：查询类请求的退避重试、熔断器、单次工具调用的总耗时预算
+    RETRY_ATTEMPTS = int(os.getenv("MCP_RETRY_ATTEMPTS", 3))  # 含首次请求的总尝试次数
+    RETRY_BASE_DELAY = float(os.getenv("MCP_RETRY_BASE_DELAY", 0.2))
+    RETRY_MAX_DELAY = float(os.getenv("MCP_RETRY_MAX_DELAY", 2))
+    BREAKER_FAILURE_THRESHOLD = int(os.getenv("MCP_BREAKER_FAILURE_THRESHOLD", 5))  # 连续失败多少次后熔断
+    BREAKER_RESET_TIMEOUT = float(os.getenv("MCP_BREAKER_RESET_TIMEOUT", 30))  # 熔断后多少秒放行探测请求
+    # 自适应限流：每个上游接口按观测到的延迟与 429/5xx 自动调整并发上限（AIMD）与令牌桶速率
+    RATE_LIMIT = os.getenv("MCP_RATE_LIMIT", "1")
+    RATE_LIMIT_INITIAL = float(os.getenv("MCP_RATE_LIMIT_INITIAL", 4))  # 每个接口的初始并发上限
+    RATE_LIMIT_MAX = float(os.getenv("MCP_RATE_LIMIT_MAX", 64))  # 并发上限的增长上界
+    RATE_LIMIT_LATENCY_TOLERANCE = float(os.getenv("MCP_RATE_LIMIT_LATENCY_TOLERANCE", 2))  # 延迟超过基线多少倍视为排队
+    TOOL_CALL_DEADLINE = float(os.getenv("MCP_TOOL_CALL_DEADLINE", 35))  # 单次工具调用的总耗时预算（秒），0 不限
+    BATCH_DEADLINE = float(os.getenv("MCP_BATCH_DEADLINE", 180))  # 批量提报的总耗时预算（秒），0 不限
+
+    # 日报缓存配置（daily.get 与 overtime.auto 共用，避免短时间内重复拉取日报列表）
+    DAILY_CACHE_TTL = float(os.getenv("MCP_DAILY_CACHE_TTL", 300))
+    DAILY_CACHE_SIZE = int(os.getenv("MCP_DAILY_CACHE_SIZE", 256))
+    DAILY_PAGE_SIZE = int(os.getenv("MCP_DAILY_PAGE_SIZE", 10))  # 日报分页拉取的每页条数
+    DAILY_MAX_PAGES = int(os.getenv("MCP_DAILY_MAX_PAGES", 20))  # 单次查找最多翻页数，防止服务端忽略过滤条件时无限翻页
+    DAILY_SYNC = os.getenv("MCP_DAILY_SYNC", "1")  # 启动时把水位线之后新增的日报增量同步到本地存储
+    DAILY_SYNC_DAYS = int(os.getenv("MCP_DAILY_SYNC_DAYS", 31))  # 首次同步（本地没有水位线）回溯的天数
+    DAILY_STORE_TTL = float(os.getenv("MCP_DAILY_STORE_TTL", 86400))  # 本地存储中的日报多久内可直接使用（秒），0 不读本地
+
+    # 批量提报配置（overtime.batch）
+    BATCH_MAX_WORKERS = int(os.getenv("MCP_BATCH_MAX_WORKERS", 4))  # 并发提报的最大线程数
+    BATCH_MAX_DATES = int(os.getenv("MCP_BATCH_MAX_DATES", 62))  # 单次批量最多日期数
+    EXIST_INDEX_TTL = float(os.getenv("MCP_EXIST_INDEX_TTL", 120))  # 区间预查结果的有效期（秒）
+
+    # JSON-RPC 并发调度：同时处理的最大请求数
+    DISPATCH_WORKERS = int(os.getenv("MCP_DISPATCH_WORKERS", 8))
+    STARTUP_BUDGET_MS = float(os.getenv("MCP_STARTUP_BUDGET_MS", 300))  # 冷启动耗时预算，超出时告警
+    METRICS_DUMP_INTERVAL = float(os.getenv("MCP_METRICS_DUMP_INTERVAL", 300))  # 指标摘要写日志的间隔（秒），0 关闭
+    PROFILE = os.getenv("MCP_PROFILE", "0")  # 为所有工具调用开启性能剖析（也可在单次调用中传 _profile=true）
+    PROFILE_TOP = int(os.getenv("MCP_PROFILE_TOP", 30))  # 剖析报告中列出的 cProfile 函数条数
+
+    # HTTP 传输（Streamable HTTP）：一个常驻进程同时服务多个 MCP 客户端
+    HTTP_HOST = os.getenv("MCP_HTTP_HOST", "127.0.0.1")
+    HTTP_PORT = int(os.getenv("MCP_HTTP_PORT", 8765))
+    HTTP_PATH = os.getenv("MCP_HTTP_PATH", "/mcp")
+    HTTP_WORKERS = int(os.getenv("MCP_HTTP_WORKERS", 32))  # 所有客户端合计同时处理的最大请求数
+    HTTP_SESSION_TTL = float(os.getenv("MCP_HTTP_SESSION_TTL", 3600))  # 会话空闲多久后失效（秒）
+    HTTP_ALLOWED_ORIGINS = os.getenv("MCP_HTTP_ALLOWED_ORIGINS", "")  # 逗号分隔的额外允许来源，本机来源始终允许
+    # 默认租户的访问密钥（其他租户在档案中配置 http_secret）；任一租户配置了密钥后所有 HTTP 请求都需要携带
+    # Authorization: Bearer <密钥>，会话与工具调用限定在密钥对应的租户；都未配置时只允许监听本机且只能使用默认租户
+    HTTP_SECRET = os.getenv("MCP_HTTP_SECRET")
 
     # 加班固定参数（MCP 统一维护，可直接在这修改，无需动任务代码）
     FIXED_OVERTIME_START = "18:30:00"
@@ -27,6 +115,55 @@ class MCPGlobalConfig:
     # MCP 日志配置
     LOG_DIR = "./logs"
     LOG_FILE = f"{LOG_DIR}/overtime_mcp.log"
+    LEDGER_FILE = os.getenv("MCP_LEDGER_FILE", f"{LOG_DIR}/overtime_ledger.db")  # 本地提报台账
+    DAILY_STORE_FILE = os.getenv("MCP_DAILY_STORE_FILE", f"{LOG_DIR}/daily_reports.db")  # 日报本地存储
+    PROFILE_DIR = os.getenv("MCP_PROFILE_DIR", f"{LOG_DIR}/profiles")  # 性能剖析报告目录
+    CASSETTE_FILE = os.getenv("MCP_CASSETTE_FILE", f"{LOG_DIR}/upstream_cassette.jsonl")  # 录制 / 回放文件
+    # 工作日历：按星期规则与节假日数据文件（法定节假日、调休上班日）判断是否需要提报
+    # 提报跳过与常驻调度共用同一套工作日规则
+    WORKDAYS = os.getenv("MCP_WORKDAYS", "1,2,3,4,5")  # 工作的星期（1=周一 … 7=周日）
+    CALENDAR_FILE = os.getenv("MCP_CALENDAR_FILE", _default_calendar_file())
+    SKIP_NON_WORKDAYS = os.getenv("MCP_SKIP_NON_WORKDAYS", "1")  # 周末与节假日直接跳过，不访问上游
+    # 常驻调度（jabanmcp --daemon）：工作日 FIXED_OVERTIME_END 之后自动按日报提报，停机期间漏掉的日期下次统一补报
+    SCHEDULER = os.getenv("MCP_SCHEDULER", "0")  # HTTP 模式下是否同时运行调度器
+    SCHEDULE_OFFSET_MINUTES = float(os.getenv("MCP_SCHEDULE_OFFSET_MINUTES", 5))  # 加班结束后多少分钟提报
+    SCHEDULE_CATCHUP_DAYS = int(os.getenv("MCP_SCHEDULE_CATCHUP_DAYS", 7))  # 最多补报最近多少天
+    SCHEDULE_TENANTS = os.getenv("MCP_SCHEDULE_TENANTS", "default")  # 逗号分隔的租户，* 表示全部
+    SCHEDULE_STATE_FILE = os.getenv("MCP_SCHEDULE_STATE_FILE", f"{LOG_DIR}/scheduler_state.json")
     MCP_LOG_LEVEL = os.getenv("MCP_LOG_LEVEL", "INFO")
+    LOG_FORMAT = os.getenv("MCP_LOG_FORMAT", "text")  # text 文本日志；json 每行一条 JSON（JSONL）
+    LOG_ROTATE = os.getenv("MCP_LOG_ROTATE", "size")  # size 按大小轮转；time 按时间轮转
+    LOG_MAX_BYTES = int(os.getenv("MCP_LOG_MAX_BYTES", 10 * 1024 * 1024))
+    LOG_ROTATE_WHEN = os.getenv("MCP_LOG_ROTATE_WHEN", "midnight")
+    LOG_BACKUP_COUNT = int(os.getenv("MCP_LOG_BACKUP_COUNT", 7))
     DATE_FORMAT = "%Y-%m-%d"  # 加班日期格式规范
     OVERTIME_CONTENT_DEFAULT = "项目研发推进，完成既定工作任务"  # 默认加班内容
+
+
+def reload_config(env_file: str = None) -> list:
+    """
+    重新读取 .env（文件中改动过的项覆盖进程环境变量）并原地刷新 MCPGlobalConfig 的类属性
+    类对象保持不变，已创建的配置实例与各模块 `from config import MCPGlobalConfig` 的引用都能看到新值
+    :return: 发生变化的配置项名称列表
+    """
+    path = env_file or os.getenv("MCP_ENV_FILE") or MCPGlobalConfig.ENV_FILE
+    if path and os.path.exists(path):
+        previous = _ENV_SNAPSHOTS.get(path)
+        if previous is None:
+            previous = _ENV_SNAPSHOTS[path] = dotenv_values(path)
+        current = dotenv_values(path)
+        # 文件里未改动的项不覆盖，避免用 .env 中的旧值顶掉客户端通过进程环境传入的配置
+        for key, value in current.items():
+            if value is not None and previous.get(key) != value:
+                os.environ[key] = value
+        _ENV_SNAPSHOTS[path] = current
+    # 在独立的模块副本中重新执行类定义，按当前环境变量求值
+    spec = importlib.util.spec_from_file_location("_config_reload", __file__)
+    fresh = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(fresh)
+    changed = []
+    for key, value in vars(fresh.MCPGlobalConfig).items():
+        if key.isupper() and getattr(MCPGlobalConfig, key, None) != value:
+            setattr(MCPGlobalConfig, key, value)
+            changed.append(key)
+    return changed
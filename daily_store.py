@@ -0,0 +1,150 @@
+# daily_store.py - 日报数据本地存储：按 DATE_ 索引的进程内缓存与磁盘存储，减少重复拉取 listJson
+import os
+import json
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from collections import OrderedDict
+
+
+class DailyReportCache:
+    """日报行缓存：按 DATE_ 索引，带 TTL 过期与容量上限的 LRU 淘汰（线程安全）"""
+    def __init__(self, ttl: float, max_size: int):
+        self.ttl = float(ttl)
+        self.max_size = max(1, int(max_size))
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def lookup(self, date: str):
+        """返回 (是否命中, 日报行)；命中但日报行为 None 表示该日期确认没有日报"""
+        with self._lock:
+            entry = self._entries.get(date)
+            if entry is None:
+                return False, None
+            expires_at, row = entry
+            if expires_at <= time.monotonic():
+                del self._entries[date]
+                return False, None
+            self._entries.move_to_end(date)
+            return True, row
+
+    def put(self, date: str, row):
+        with self._lock:
+            self._store(date, row, time.monotonic() + self.ttl)
+
+    def put_rows(self, rows):
+        """批量写入一次 listJson 拉取到的所有日报行"""
+        expires_at = time.monotonic() + self.ttl
+        seen = set()
+        with self._lock:
+            for row in rows:
+                date = row.get("DATE_")
+                # 同一日期有多条时以列表中第一条为准，与逐行查找的结果保持一致
+                if date and date not in seen:
+                    seen.add(date)
+                    self._store(date, row, expires_at)
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _store(self, date, row, expires_at):
+        self._entries[date] = (expires_at, row)
+        self._entries.move_to_end(date)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+
+class DailyReportStore:
+    """
+    日报行的磁盘存储（SQLite）：按 DATE_ 持久化拉取到的日报行，并记录增量同步的水位线
+    进程重启后 daily.get 直接从本地读取，上游只需拉取水位线之后新增的日报
+    """
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS daily_rows ("
+                " date TEXT PRIMARY KEY,"
+                " row TEXT NOT NULL,"
+                " synced_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT NOT NULL)"
+            )
+
+    def get(self, date: str, max_age: float = None):
+        """
+        返回已持久化的日报行，本地没有或已不新鲜时返回 None（不代表上游没有）
+        :param max_age: 只返回 max_age 秒内拉取、且拉取时该日期已经过去的日报行；
+                        当天拉取的当天日报可能还会修改，不从本地存储返回
+        """
+        if max_age is not None and max_age <= 0:
+            return None
+        query = "SELECT row FROM daily_rows WHERE date = ?"
+        params = (date,)
+        if max_age is not None:
+            cutoff = (datetime.now() - timedelta(seconds=max_age)).strftime("%Y-%m-%d %H:%M:%S")
+            query += " AND synced_at >= ? AND substr(synced_at, 1, 10) > date"
+            params = (date, cutoff)
+        with self._lock:
+            found = self._conn.execute(query, params).fetchone()
+        return json.loads(found[0]) if found else None
+
+    def put_rows(self, rows):
+        """批量写入一页日报行；同一日期有多条时以列表中第一条为准，与内存缓存保持一致"""
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        records = {}
+        for row in rows:
+            date = row.get("DATE_")
+            if date and date not in records:
+                records[date] = (date, json.dumps(row, ensure_ascii=False), now_str)
+        if not records:
+            return
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO daily_rows (date, row, synced_at) VALUES (?, ?, ?)",
+                    list(records.values()),
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def last_synced_date(self):
+        """上次增量同步覆盖到的最新日期，从未同步时返回 None"""
+        with self._lock:
+            found = self._conn.execute("SELECT value FROM sync_state WHERE key = 'last_synced_date'").fetchone()
+        return found[0] if found else None
+
+    def set_last_synced_date(self, date: str):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sync_state (key, value) VALUES ('last_synced_date', ?)", (date,)
+            )
+
+    def clear(self):
+        """清空日报行与水位线（切换上游后本地数据不再可信）"""
+        with self._lock:
+            self._conn.execute("DELETE FROM daily_rows")
+            self._conn.execute("DELETE FROM sync_state")
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM daily_rows").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
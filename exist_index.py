@@ -0,0 +1,79 @@
+# exist_index.py - 已存在加班记录的本地区间索引，批量规划时代替逐日 validExist 查询
+import bisect
+import threading
+import time
+
+
+class OvertimeIntervalIndex:
+    """
+    已存在加班记录的区间索引：区间按开始时间有序且互不重叠（插入时合并），
+    重叠判断只需二分定位前一个区间，O(log n)
+    同时记录哪些日期已被区间查询覆盖，覆盖信息带 TTL，过期后回退到逐日查询
+    """
+    def __init__(self, ttl: float):
+        self.ttl = float(ttl)
+        self._starts = []
+        self._ends = []
+        self._covered = {}
+        self._lock = threading.Lock()
+
+    def add(self, start_time: str, end_time: str):
+        with self._lock:
+            idx = bisect.bisect_left(self._starts, start_time)
+            # 与前一个区间相接或重叠时向前合并
+            if idx > 0 and self._ends[idx - 1] >= start_time:
+                idx -= 1
+                start_time = self._starts[idx]
+            end_idx = idx
+            while end_idx < len(self._starts) and self._starts[end_idx] <= end_time:
+                end_time = max(end_time, self._ends[end_idx])
+                end_idx += 1
+            self._starts[idx:end_idx] = [start_time]
+            self._ends[idx:end_idx] = [end_time]
+
+    def overlaps(self, start_time: str, end_time: str) -> bool:
+        with self._lock:
+            idx = bisect.bisect_left(self._starts, end_time)
+            return idx > 0 and self._ends[idx - 1] > start_time
+
+    def discard(self, start_time: str, end_time: str):
+        """移除与给定时间段重叠的区间（重新做区间查询前清掉旧数据）"""
+        with self._lock:
+            keep = [
+                (s, e) for s, e in zip(self._starts, self._ends)
+                if e <= start_time or s >= end_time
+            ]
+            self._starts = [s for s, _ in keep]
+            self._ends = [e for _, e in keep]
+
+    def mark_covered(self, dates):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            for date in dates:
+                self._covered[date] = expires_at
+
+    def uncover(self, dates):
+        """撤销日期的覆盖标记（区间查询失败后这些日期回退到逐日查询）"""
+        with self._lock:
+            for date in dates:
+                self._covered.pop(date, None)
+
+    def covers(self, date: str) -> bool:
+        with self._lock:
+            expires_at = self._covered.get(date)
+            if expires_at is None:
+                return False
+            if expires_at <= time.monotonic():
+                del self._covered[date]
+                return False
+            return True
+
+    def clear(self):
+        with self._lock:
+            self._starts = []
+            self._ends = []
+            self._covered = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._starts)
@@ -0,0 +1,243 @@
+# ledger.py - 本地提报台账：记录每个加班时段的提报状态，重复提报在本地直接拦截；并维护按日 / 周 / 月的加班汇总
+import os
+import uuid
+import sqlite3
+import threading
+from datetime import date, datetime
+
+# 台账状态：pending 提报中；unknown 结果未知（请求已发出但未收到响应）；
+# success 流程已启动；exists 经上游确认已存在记录
+STATUS_PENDING = "pending"
+STATUS_UNKNOWN = "unknown"
+STATUS_SUCCESS = "success"
+STATUS_EXISTS = "exists"
+
+# 本进程的实例标识：区分 pending 记录是否由当前进程写入；不用裸 pid，
+# 容器内每次重启通常都是 PID 1，崩溃遗留的 pending 会被误认为仍在进行中
+PROCESS_ID = f"{os.getpid()}-{uuid.uuid4().hex}"
+
+# 加班汇总中的每日状态：success 本工具已发起流程（计入时长）；exists 上游已有记录；
+# failed 提报失败；skipped 因其他原因未提报（如周末、节假日）
+SUMMARY_FAILED = "failed"
+SUMMARY_SKIPPED = "skipped"
+SUMMARY_STATUSES = (STATUS_SUCCESS, STATUS_EXISTS, SUMMARY_FAILED, SUMMARY_SKIPPED)
+# 同一天多次提报时状态只升不降：已成功的日期再次提报被跳过不会覆盖为 skipped
+_SUMMARY_RANK = {SUMMARY_FAILED: 1, SUMMARY_SKIPPED: 1, STATUS_EXISTS: 2, STATUS_SUCCESS: 3}
+
+
+def summary_periods(overtime_date: str) -> tuple:
+    """日期所属的汇总周期：(("week", "2026-W02"), ("month", "2026-01"))，周按 ISO 周编号"""
+    day = date.fromisoformat(overtime_date)
+    iso_year, iso_week, _ = day.isocalendar()
+    return ("week", f"{iso_year}-W{iso_week:02d}"), ("month", day.strftime("%Y-%m"))
+
+
+def overtime_hours(start_time: str, end_time: str) -> int:
+    """加班时长（整小时），与流程表单中的 OVERTIME_DURATION_ 口径一致"""
+    start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
+    end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
+    return int((end_dt - start_dt).total_seconds() // 3600)
+
+
+class SubmissionLedger:
+    """基于 SQLite 的提报台账，按（加班日期, 开始时间, 结束时间）唯一记录一次提报"""
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS submissions ("
+                " overtime_date TEXT NOT NULL,"
+                " start_time TEXT NOT NULL,"
+                " end_time TEXT NOT NULL,"
+                " status TEXT NOT NULL,"
+                " inst_id TEXT,"
+                " pid INTEGER,"
+                " updated_at TEXT NOT NULL,"
+                " owner TEXT,"
+                " PRIMARY KEY (overtime_date, start_time, end_time))"
+            )
+            columns = {row["name"] for row in self._conn.execute("PRAGMA table_info(submissions)")}
+            if "owner" not in columns:
+                # 旧版台账只有 pid 列；迁移后旧记录的 owner 为空，不属于任何在运行的进程
+                self._conn.execute("ALTER TABLE submissions ADD COLUMN owner TEXT")
+            backfill = self._conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'overtime_days'"
+            ).fetchone() is None
+            # 加班汇总：overtime_days 为每天的最终状态，overtime_periods 为按周 / 月累计的时长与各状态天数，
+            # 每次写入每日状态时在同一事务内增量调整所属周期，查询只读取对应周期的行
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS overtime_days ("
+                " overtime_date TEXT PRIMARY KEY,"
+                " status TEXT NOT NULL,"
+                " hours REAL NOT NULL,"
+                " inst_id TEXT,"
+                " updated_at TEXT NOT NULL)"
+            )
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS overtime_periods ("
+                " period_type TEXT NOT NULL,"
+                " period_key TEXT NOT NULL,"
+                " hours REAL NOT NULL DEFAULT 0,"
+                + "".join(f" {status}_days INTEGER NOT NULL DEFAULT 0," for status in SUMMARY_STATUSES)
+                + " PRIMARY KEY (period_type, period_key))"
+            )
+        if backfill:
+            self._backfill_summary()
+
+    def get(self, overtime_date: str, start_time: str, end_time: str):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT * FROM submissions WHERE overtime_date = ? AND start_time = ? AND end_time = ?",
+                (overtime_date, start_time, end_time),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def record(self, overtime_date: str, start_time: str, end_time: str, status: str, inst_id: str = None):
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO submissions"
+                " (overtime_date, start_time, end_time, status, inst_id, pid, updated_at, owner)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (overtime_date, start_time, end_time, status, inst_id, os.getpid(), now_str, PROCESS_ID),
+            )
+
+    @staticmethod
+    def is_own(entry: dict) -> bool:
+        """记录是否由当前进程写入"""
+        return entry.get("owner") == PROCESS_ID
+
+    def remove(self, overtime_date: str, start_time: str, end_time: str):
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM submissions WHERE overtime_date = ? AND start_time = ? AND end_time = ?",
+                (overtime_date, start_time, end_time),
+            )
+
+    def in_doubt(self) -> list:
+        """结果未确认的记录：其他进程遗留的 pending（进程中途退出）以及 unknown"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM submissions WHERE status = ? OR (status = ? AND owner IS NOT ?)"
+                " ORDER BY overtime_date",
+                (STATUS_UNKNOWN, STATUS_PENDING, PROCESS_ID),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def _backfill_summary(self):
+        """汇总表首次创建时，用台账中已有的成功 / 已存在记录初始化"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT * FROM submissions WHERE status IN (?, ?) ORDER BY overtime_date",
+                (STATUS_SUCCESS, STATUS_EXISTS),
+            ).fetchall()
+        for row in rows:
+            hours = overtime_hours(row["start_time"], row["end_time"]) if row["status"] == STATUS_SUCCESS else 0
+            self.record_day(row["overtime_date"], row["status"], hours, row["inst_id"])
+
+    def record_day(self, overtime_date: str, status: str, hours: float = 0, inst_id: str = None) -> bool:
+        """
+        记录某天的提报结果并增量更新所属周、月的汇总
+        :param status: SUMMARY_STATUSES 之一；低于已记录状态的结果被忽略
+        :return: 汇总是否有变化
+        """
+        if status not in _SUMMARY_RANK:
+            raise ValueError(f"未知的汇总状态：{status}")
+        now_str = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            # IMMEDIATE：多个进程共用台账文件时，读取旧状态与调整汇总之间不会被其他进程插入写入
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                old = self._conn.execute(
+                    "SELECT status, hours, inst_id FROM overtime_days WHERE overtime_date = ?", (overtime_date,)
+                ).fetchone()
+                if old is not None and (
+                    _SUMMARY_RANK[old["status"]] > _SUMMARY_RANK[status]
+                    or (old["status"], old["hours"], old["inst_id"]) == (status, hours, inst_id or old["inst_id"])
+                ):
+                    self._conn.execute("COMMIT")
+                    return False
+                inst_id = inst_id or (old["inst_id"] if old is not None else None)
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO overtime_days (overtime_date, status, hours, inst_id, updated_at)"
+                    " VALUES (?, ?, ?, ?, ?)",
+                    (overtime_date, status, hours, inst_id, now_str),
+                )
+                for period_type, period_key in summary_periods(overtime_date):
+                    self._conn.execute(
+                        "INSERT OR IGNORE INTO overtime_periods (period_type, period_key) VALUES (?, ?)",
+                        (period_type, period_key),
+                    )
+                    if old is not None:
+                        self._conn.execute(
+                            f"UPDATE overtime_periods SET hours = hours - ?, {old['status']}_days = {old['status']}_days - 1"
+                            " WHERE period_type = ? AND period_key = ?",
+                            (old["hours"], period_type, period_key),
+                        )
+                    self._conn.execute(
+                        f"UPDATE overtime_periods SET hours = hours + ?, {status}_days = {status}_days + 1"
+                        " WHERE period_type = ? AND period_key = ?",
+                        (hours, period_type, period_key),
+                    )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return True
+
+    def summary(self, start_date: str, end_date: str) -> dict:
+        """
+        查询区间内的加班汇总：逐日明细，以及区间涉及的各周、各月的累计（周、月为整周整月的合计）
+        按主键范围读取，耗时与区间内的天数和周期数成正比，与历史总量无关
+        """
+        (_, start_week), (_, start_month) = summary_periods(start_date)
+        (_, end_week), (_, end_month) = summary_periods(end_date)
+        with self._lock:
+            days = self._conn.execute(
+                "SELECT overtime_date, status, hours, inst_id, updated_at FROM overtime_days"
+                " WHERE overtime_date BETWEEN ? AND ? ORDER BY overtime_date",
+                (start_date, end_date),
+            ).fetchall()
+            weeks = self._conn.execute(
+                "SELECT * FROM overtime_periods WHERE period_type = 'week' AND period_key BETWEEN ? AND ?"
+                " ORDER BY period_key",
+                (start_week, end_week),
+            ).fetchall()
+            months = self._conn.execute(
+                "SELECT * FROM overtime_periods WHERE period_type = 'month' AND period_key BETWEEN ? AND ?"
+                " ORDER BY period_key",
+                (start_month, end_month),
+            ).fetchall()
+
+        def period_entry(row, name: str) -> dict:
+            entry = {name: row["period_key"], "hours": row["hours"]}
+            entry.update({status: row[f"{status}_days"] for status in SUMMARY_STATUSES})
+            return entry
+
+        return {
+            "start_date": start_date,
+            "end_date": end_date,
+            "total_hours": sum(row["hours"] for row in days),
+            "days": [
+                {
+                    "date": row["overtime_date"],
+                    "status": row["status"],
+                    "hours": row["hours"],
+                    "inst_id": row["inst_id"],
+                    "updated_at": row["updated_at"],
+                }
+                for row in days
+            ],
+            "weeks": [period_entry(row, "week") for row in weeks],
+            "months": [period_entry(row, "month") for row in months],
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
@@ -1,34 +1,71 @@
 # mcp_core.py - 加班提报 MCP 主控程序（Master Control Program）
+import time
+
+_PROCESS_START = time.perf_counter()  # 启动耗时计时起点
+
 import os
 import sys
 import json
+import atexit
+import queue
+import signal
 import logging
+import threading
+from contextlib import nullcontext
+from functools import cached_property
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
-from config import MCPGlobalConfig
+from config import MCPGlobalConfig, reload_config
+from mcp_logging import JsonLineFormatter, build_file_handler, start_queue_logging
+from metrics import REGISTRY as METRICS
+from resilience import RequestCancelledError, cancel_scope, check_cancelled, deadline_scope, rate_limiter_snapshot
 from overtime_task import OvertimeSubmitTask, TokenExpiredError
+from profiling import ProfileSession, stage
+from tenants import DEFAULT_TENANT_ID, TenantProfile, load_tenant_profiles
+from upstream import is_truthy
+
+# 请求已被客户端取消（沿用 LSP 的 RequestCancelled 错误码），该响应不会写回客户端
+REQUEST_CANCELLED_CODE = -32800
 
 class OvertimeMCP:
     """加班提报 MCP 主控程序：统一管理加班提报任务、配置、日志、执行调度"""
     def __init__(self, enable_console_log: bool = True):
         # 1. 初始化全局配置
         self.config = MCPGlobalConfig()
-        self.overtime_task = OvertimeSubmitTask()
+        # 2. 加载租户档案：每个租户一个子任务，会话、缓存与台账互相隔离
+        self.tenants = load_tenant_profiles(self.config)
+        self.overtime_task = OvertimeSubmitTask(self.tenants[DEFAULT_TENANT_ID])
+        self._tasks = {DEFAULT_TENANT_ID: self.overtime_task}
+        self._tasks_lock = threading.Lock()
         self._init_mcp_logger(enable_console_log)
+        self._token_expired = threading.Event()
+        self._health_thread = None
+        # 在途工具调用：请求 id -> 取消信号，收到 notifications/cancelled 时置位
+        self._requests = {}
+        self._requests_lock = threading.Lock()
+        # 配置热更新：记录被监视文件的修改时间，变化后在下一次工具调用前重新加载
+        self._reload_lock = threading.Lock()
+        self._watched_mtimes = self._read_watched_mtimes()
+        self._print_mcp_start_info()
+        self._report_in_doubt_submissions(self.overtime_task)
+
+    @cached_property
+    def package_version(self) -> str:
+        """包版本号（首次使用时才解析，避免拖慢冷启动）"""
         try:
             from importlib.metadata import version
-            self.package_version = version("jabanmcp")
+            return version("jabanmcp")
         except Exception:
             try:
                 import tomllib
-                with open("pyproject.toml", "rb") as f:
-                    data = tomllib.load(f)
-                    self.package_version = data["project"]["version"]
+                pyproject = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pyproject.toml")
+                with open(pyproject, "rb") as f:
+                    return tomllib.load(f)["project"]["version"]
             except Exception:
-                self.package_version = "Unknown"
-        self._print_mcp_start_info()
+                return "Unknown"
 
     def _init_mcp_logger(self, enable_console_log: bool):
-        """MCP 日志初始化：同时输出到控制台和日志文件"""
+        """MCP 日志初始化：同时输出到控制台和日志文件，写入由后台线程经队列异步完成"""
         if not os.path.exists(self.config.LOG_DIR):
             os.makedirs(self.config.LOG_DIR)
 
@@ -42,56 +79,880 @@ class OvertimeMCP:
             datefmt="%Y-%m-%d %H:%M:%S"
         )
 
-        file_handler = logging.FileHandler(self.config.LOG_FILE, encoding="utf-8", errors="replace")
-        file_handler.setFormatter(formatter)
-
-        logger.addHandler(file_handler)
+        file_handler = build_file_handler(self.config)
+        if str(self.config.LOG_FORMAT).lower() == "json":
+            file_handler.setFormatter(JsonLineFormatter())
+        else:
+            file_handler.setFormatter(formatter)
+        handlers = [file_handler]
 
         if enable_console_log:
             console_handler = logging.StreamHandler(stream=sys.stderr)
             console_handler.setFormatter(formatter)
-            logger.addHandler(console_handler)
+            handlers.append(console_handler)
 
+        self._log_listener = start_queue_logging(logger, handlers)
+        # 单次运行模式直接返回时也要保证队列中的日志落盘
+        atexit.register(self._stop_logging)
         self.logger = logger
 
+    def _stop_logging(self):
+        listener, self._log_listener = self._log_listener, None
+        if listener is not None:
+            listener.stop()
+
     def _print_mcp_start_info(self):
         """MCP 启动时打印欢迎信息和配置概要"""
         self.logger.info("=" * 50)
         self.logger.info("加班提报 MCP 主控程序启动成功")
 
-        self.logger.info(f"MCP 版本：{self.package_version}")
-        self.logger.info(f"接口地址：{self.config.API_URL}")
-        self.logger.info(f"固定加班时间：{self.config.FIXED_OVERTIME_START} - {self.config.FIXED_OVERTIME_END}")
-        self.logger.info(f"日志文件路径：{self.config.LOG_FILE}")
+        self.logger.info("接口地址：%s", self.config.API_URL)
+        self.logger.info("固定加班时间：%s - %s", self.config.FIXED_OVERTIME_START, self.config.FIXED_OVERTIME_END)
+        self.logger.info("日志文件路径：%s", self.config.LOG_FILE)
+        self.logger.info("租户数量：%d", len(self.tenants))
         self.logger.info("=" * 50)
 
-    def dispatch_overtime_task(self, overtime_date: str, overtime_content: str = None):
+    def report_startup_time(self):
+        """记录从进程导入到可以接收请求的耗时，超出 STARTUP_BUDGET_MS 时告警"""
+        elapsed_ms = (time.perf_counter() - _PROCESS_START) * 1000
+        if elapsed_ms > self.config.STARTUP_BUDGET_MS:
+            self.logger.warning("MCP 启动耗时 %.1f ms，超出预算 %.0f ms", elapsed_ms, self.config.STARTUP_BUDGET_MS)
+        else:
+            self.logger.info("MCP 启动耗时 %.1f ms", elapsed_ms)
+
+    def start_health_check(self, notify=None):
+        """
+        后台执行令牌健康检查，同时预热上游连接，initialize 无需等待
+        :param notify: 可选的通知回调 notify(level, message)，检查失败时推送给客户端
+        """
+        if self._health_thread is not None:
+            return
+
+        def run():
+            try:
+                ok = self.overtime_task.health_check_token()
+            except TokenExpiredError:
+                # 令牌过期在下一次工具调用时以 -40100 返回并停止服务
+                self._token_expired.set()
+                self.logger.error("后台令牌健康检查失败：Token 已过期")
+                if notify:
+                    notify("error", "Token过期，请重新登录或更新 OVERTIME_API_TOKEN")
+                return
+            if ok:
+                self.logger.info("后台令牌健康检查通过，上游连接已预热")
+                self.sync_daily_reports(self.overtime_task)
+            else:
+                self.logger.warning("初始化阶段令牌健康检查失败（网络异常或非401），继续启动 MCP")
+                if notify:
+                    notify("warning", "令牌健康检查失败（网络异常或非401），工具调用可能失败")
+
+        self._health_thread = threading.Thread(target=run, name="mcp-health-check", daemon=True)
+        self._health_thread.start()
+
+    def sync_daily_reports(self, task: OvertimeSubmitTask):
+        """把水位线之后新增的日报增量同步到本地存储，失败只记录日志，daily.get 回退到按需查询"""
+        if not is_truthy(self.config.DAILY_SYNC):
+            return
+        started = time.perf_counter()
+        try:
+            count = task.sync_daily_reports()
+        except TokenExpiredError:
+            self.logger.warning("[%s] 日报增量同步失败：Token 已过期", task.tenant.tenant_id)
+            return
+        except Exception as e:
+            self.logger.warning("[%s] 日报增量同步失败：%s", task.tenant.tenant_id, e)
+            return
+        self.logger.info(
+            "[%s] 日报增量同步完成：拉取 %d 条，本地共 %d 条，耗时 %.1f ms",
+            task.tenant.tenant_id, count, len(task.daily_store), (time.perf_counter() - started) * 1000,
+        )
+
+    def start_metrics_dump(self):
+        """按 METRICS_DUMP_INTERVAL 定期把指标摘要写入日志（0 表示关闭）"""
+        interval = self.config.METRICS_DUMP_INTERVAL
+        if interval <= 0 or getattr(self, "_metrics_thread", None) is not None:
+            return
+
+        def run():
+            while True:
+                time.sleep(interval)
+                lines = METRICS.summary_lines()
+                if lines:
+                    self.logger.info("运行指标摘要：\n%s", "\n".join(lines))
+
+        self._metrics_thread = threading.Thread(target=run, name="mcp-metrics-dump", daemon=True)
+        self._metrics_thread.start()
+
+    def raise_if_token_expired(self):
+        """后台健康检查已发现令牌过期时，在首次工具调用上报告"""
+        if self._token_expired.is_set():
+            raise TokenExpiredError("Token 已过期")
+
+    def _report_in_doubt_submissions(self, task: OvertimeSubmitTask):
+        """从本地台账恢复上次未确认结果的提报，下次提报对应日期时会先向上游确认"""
+        for entry in task.ledger.in_doubt():
+            self.logger.warning(
+                "[%s] 上次提报结果未确认：%s %s - %s（状态 %s，更新于 %s）",
+                task.tenant.tenant_id, entry["overtime_date"], entry["start_time"], entry["end_time"],
+                entry["status"], entry["updated_at"],
+            )
+
+    @property
+    def hot_reload_enabled(self) -> bool:
+        return is_truthy(self.config.HOT_RELOAD)
+
+    def _read_watched_mtimes(self) -> dict:
+        mtimes = {}
+        for path in (self.config.ENV_FILE, self.config.TENANTS_FILE):
+            if path:
+                try:
+                    mtimes[path] = os.stat(path).st_mtime_ns
+                except OSError:
+                    mtimes[path] = None
+        return mtimes
+
+    def refresh_config_if_changed(self):
+        """被监视的 .env 或租户档案有改动时热更新配置（每次工具调用前检查，只做一次 stat）"""
+        if self.hot_reload_enabled and self._read_watched_mtimes() != self._watched_mtimes:
+            self.reload_config("配置文件已修改")
+
+    def reload_config(self, reason: str) -> list:
+        """
+        热更新：重新读取 .env 与租户档案，原地刷新全局配置与各租户子任务的请求头、会话与上游地址
+        缓存、台账与连接池（参数未变时）全部保留
+        :return: 发生变化的配置项名称列表
+        """
+        with self._reload_lock:
+            changed = reload_config()
+            try:
+                tenants = load_tenant_profiles(self.config)
+            except (OSError, ValueError) as e:
+                # 档案文件写到一半或格式错误：其他租户沿用旧档案，默认租户按新配置刷新
+                self.logger.error("租户档案重新加载失败，沿用旧档案：%s", e)
+                tenants = dict(self.tenants)
+                tenants[DEFAULT_TENANT_ID] = TenantProfile(DEFAULT_TENANT_ID, self.config)
+            previous_token = self.overtime_task.tenant.token
+            with self._tasks_lock:
+                for tenant_id, task in self._tasks.items():
+                    profile = tenants.get(tenant_id)
+                    if profile is not None:
+                        task.apply_profile(profile)
+            self.tenants = tenants
+            if self.overtime_task.tenant.token != previous_token:
+                self._token_expired.clear()
+            self._watched_mtimes = self._read_watched_mtimes()
+        # 只记录配置项名称，避免令牌等敏感值写入日志
+        self.logger.info("配置已热更新（%s），变化项：%s", reason, ", ".join(changed) or "无")
+        return changed
+
+    def current_token(self, tenant_id: str = None) -> str:
+        return self.get_task(tenant_id).tenant.token
+
+    def recover_token(self, tenant_id: str, failed_token: str) -> bool:
+        """
+        令牌过期后尝试热更新令牌
+        :param failed_token: 失败请求所用的令牌；其他请求已换上新令牌时不再重复加载
+        :return: 令牌已更换（调用方可重试一次）时返回 True
+        """
+        if not self.hot_reload_enabled:
+            return False
+        if self.current_token(tenant_id) == failed_token:
+            self.reload_config("令牌过期")
+        return self.current_token(tenant_id) != failed_token
+
+    def is_default_tenant(self, tenant_id: str = None) -> bool:
+        return (tenant_id or DEFAULT_TENANT_ID) == DEFAULT_TENANT_ID
+
+    def get_task(self, tenant_id: str = None) -> OvertimeSubmitTask:
+        """
+        按租户获取加班提报子任务，首次使用时创建
+        :param tenant_id: 租户 ID，不传则为默认租户
+        :raises ValueError: 租户不存在
+        """
+        tenant_id = tenant_id or DEFAULT_TENANT_ID
+        task = self._tasks.get(tenant_id)
+        if task is not None:
+            return task
+        with self._tasks_lock:
+            task = self._tasks.get(tenant_id)
+            if task is None:
+                profile = self.tenants.get(tenant_id)
+                if profile is None:
+                    raise ValueError(f"未知的租户：{tenant_id}")
+                task = OvertimeSubmitTask(profile)
+                self._tasks[tenant_id] = task
+                self._report_in_doubt_submissions(task)
+                threading.Thread(
+                    target=self.sync_daily_reports, args=(task,), name=f"mcp-daily-sync-{tenant_id}", daemon=True
+                ).start()
+        return task
+
+    def get_daily_report(self, overtime_date: str, tenant_id: str = None) -> dict:
+        """查询日报（daily.get），上游请求共享 TOOL_CALL_DEADLINE 总耗时预算"""
+        task = self.get_task(tenant_id)
+        with deadline_scope(self.config.TOOL_CALL_DEADLINE):
+            return task.get_daily_report(overtime_date)
+
+    def dispatch_overtime_task(self, overtime_date: str, overtime_content: str = None, tenant_id: str = None, force: bool = False):
         """
         MCP 核心调度方法：分发加班提报子任务，统一收集结果并记录日志
         :param overtime_date: 加班日期（YYYY-MM-DD）
         :param overtime_content: 加班内容
+        :param tenant_id: 租户 ID，不传则为默认租户
+        :param force: 忽略本地台账中已成功的记录重新提报（审批驳回或撤回后使用）
         :return: 任务执行结果
         """
-        self.logger.info(f"开始调度加班提报任务，目标日期：{overtime_date}")
+        task = self.get_task(tenant_id)
+        self.logger.info("开始调度加班提报任务，目标日期：%s，租户：%s", overtime_date, task.tenant.tenant_id)
 
-        # 调度子任务执行
-        task_result = self.overtime_task.execute(overtime_date, overtime_content)
+        # 调度子任务执行：所有上游请求共享 TOOL_CALL_DEADLINE 总耗时预算
+        with stage("dispatch.execute"), deadline_scope(self.config.TOOL_CALL_DEADLINE):
+            task_result = task.execute(overtime_date, overtime_content, force)
 
         # 记录任务执行结果（MCP 核心：留存执行痕迹）
-        if task_result["task_status"] == "success":
-            self.logger.info(f"加班提报任务执行成功 - 响应码：{task_result.get('status_code')}")
-            # 使用 repr 避免非法字符导致日志写入失败
-            self.logger.debug(f"任务详细响应：{repr(task_result['data'])}")
-        elif task_result["task_status"] == "skipped":
-            self.logger.info(f"加班提报任务被跳过 - 原因：{task_result['message']}")
-            self.logger.debug(f"跳过依据：{repr(task_result.get('data'))}")
-        else:
-            self.logger.error(f"加班提报任务执行失败 - 原因：{task_result['message']}")
+        with stage("dispatch.log"):
+            if task_result["task_status"] == "success":
+                self.logger.info("加班提报任务执行成功 - 响应码：%s", task_result.get("status_code"))
+                # 使用 %r 避免非法字符导致日志写入失败；未开启 DEBUG 时不会构造 repr
+                self.logger.debug("任务详细响应：%r", task_result["data"])
+            elif task_result["task_status"] == "skipped":
+                self.logger.info("加班提报任务被跳过 - 原因：%s", task_result["message"])
+                self.logger.debug("跳过依据：%r", task_result.get("data"))
+            else:
+                self.logger.error("加班提报任务执行失败 - 原因：%s", task_result["message"])
 
         return task_result
+
+    def dispatch_overtime_batch(self, dates: list = None, start_date: str = None, end_date: str = None, overtime_content: str = None, tenant_id: str = None, force: bool = False):
+        """
+        MCP 批量调度方法：展开日期后并发执行加班提报，返回逐日结果
+        :param dates: 加班日期列表
+        :param start_date: 区间开始日期（与 end_date 配合使用）
+        :param end_date: 区间结束日期
+        :param overtime_content: 统一的加班内容
+        :param tenant_id: 租户 ID，不传则为默认租户
+        :param force: 同 dispatch_overtime_task
+        :return: 批量执行结果（results 为逐日结果数组）
+        """
+        task = self.get_task(tenant_id)
+        target_dates = task.expand_dates(dates, start_date, end_date)
+        self.logger.info(
+            "开始调度批量加班提报任务，共 %d 天：%s ~ %s，租户：%s",
+            len(target_dates), target_dates[0], target_dates[-1], task.tenant.tenant_id,
+        )
+
+        with deadline_scope(self.config.BATCH_DEADLINE):
+            results = task.execute_batch(target_dates, overtime_content, force=force)
+
+        summary = {"success": 0, "skipped": 0, "failed": 0}
+        for task_result in results:
+            status = task_result["task_status"]
+            summary[status] = summary.get(status, 0) + 1
+            if status == "failed":
+                self.logger.error("%s 加班提报失败 - 原因：%s", task_result["overtime_date"], task_result["message"])
+            else:
+                self.logger.debug("%s 加班提报结果：%s", task_result["overtime_date"], status)
+        self.logger.info(
+            "批量加班提报完成 - 成功 %d，跳过 %d，失败 %d", summary["success"], summary["skipped"], summary["failed"]
+        )
+        return {"task_type": "overtime_batch", "summary": summary, "results": results}
+
+    def begin_request(self, request_id, session_id: str = None) -> threading.Event:
+        """
+        登记在途请求并返回其取消信号；同一 id 重复登记时返回同一个信号
+        :param session_id: HTTP 传输的会话 ID，不同客户端的请求 id 互不冲突；stdio 为 None
+        """
+        if request_id is None or not is_valid_request_id(request_id):
+            return threading.Event()
+        with self._requests_lock:
+            return self._requests.setdefault((session_id, request_id), threading.Event())
+
+    def end_request(self, request_id, session_id: str = None):
+        if not is_valid_request_id(request_id):
+            return
+        with self._requests_lock:
+            self._requests.pop((session_id, request_id), None)
+
+    def cancel_request(self, request_id, session_id: str = None) -> bool:
+        """取消在途请求；请求已完成或 id 未知时忽略并返回 False"""
+        if not is_valid_request_id(request_id):
+            return False
+        with self._requests_lock:
+            cancel_event = self._requests.get((session_id, request_id))
+        if cancel_event is None:
+            return False
+        cancel_event.set()
+        return True
+
+    def close(self):
+        """MCP 退出时释放所有租户子任务持有的连接池，并把队列中剩余的日志写完"""
+        for task in list(self._tasks.values()):
+            task.close()
+        self._stop_logging()
+
+
+def _parse_batch_arg(value: str) -> dict:
+    """解析命令行批量参数：支持 2026-01-05..2026-01-09 区间或 2026-01-05,2026-01-07 列表"""
+    if ".." in value:
+        start_date, end_date = value.split("..", 1)
+        return {"start_date": start_date.strip(), "end_date": end_date.strip()}
+    return {"dates": [d.strip() for d in value.split(",") if d.strip()]}
+
+
+def _client_timeout(params: dict):
+    """客户端在 _meta.timeoutMs 中声明的等待时长（秒），与服务端预算取较小值；未声明时返回 None"""
+    meta = params.get("_meta") or {}
+    try:
+        timeout_ms = float(meta.get("timeoutMs"))
+    except (TypeError, ValueError):
+        return None
+    return timeout_ms / 1000 if timeout_ms > 0 else None
+
+
+def _tool_definitions() -> list:
+    """MCP 工具清单（tools/list 返回内容）"""
+    return [
+        {
+            "name": "daily.get",
+            "description": "获取指定日期的日报内容。建议在调用 overtime.submit 之前先调用此工具获取日报，利用模型能力将日报内容润色为正式的加班申请理由。",
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "date": {
+                        "type": "string",
+                        "description": "日期，格式为 YYYY-MM-DD",
+                    },
+                    "tenant": {
+                        "type": "string",
+                        "description": "可选，租户（员工）ID，对应 MCP_TENANTS_FILE 中的档案；不传则使用默认租户",
+                    },
+                },
+                "required": ["date"],
+            },
+        },
+        {
+            "name": "overtime.submit",
+            "description": (
+                "根据指定日期提交加班申请。"
+                "支持单次调用：未提供content时将自动从日报获取并润色后提交。"
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "date": {
+                        "type": "string",
+                        "description": "加班日期，格式为 YYYY-MM-DD，例如 2025-12-25",
+                    },
+                    "content": {
+                        "type": "string",
+                        "description": "可选，经过模型润色后的加班内容。建议提供此参数以获得更好的提报质量。不要出现'工作内容润色：依据','加班时间','提报目的','根据','日报','项目编号'等字眼。这就是个简短加班内容, 主要为了修改bug才加班",
+                    },
+                    "force": {
+                        "type": "boolean",
+                        "description": "可选，默认 false。为 true 时忽略本地已成功提报的记录重新提交（申请被驳回或撤回后使用），仍会向后端校验是否存在未完成的记录",
+                    },
+                    "tenant": {
+                        "type": "string",
+                        "description": "可选，租户（员工）ID，对应 MCP_TENANTS_FILE 中的档案；不传则使用默认租户",
+                    },
+                },
+                "required": ["date"],
+            },
+        },
+        {
+            "name": "overtime.auto",
+            "description": (
+                "一次调用完成加班申请：只传日期即可。"
+                "如未传 content，将自动读取当日日报并润色后提交。"
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "date": {
+                        "type": "string",
+                        "description": "加班日期，格式为 YYYY-MM-DD",
+                    },
+                    "content": {
+                        "type": "string",
+                        "description": "可选，自定义加班内容；不传则自动读取日报并润色",
+                    },
+                    "tenant": {
+                        "type": "string",
+                        "description": "可选，租户（员工）ID，对应 MCP_TENANTS_FILE 中的档案；不传则使用默认租户",
+                    },
+                },
+                "required": ["date"],
+            },
+        },
+        {
+            "name": "overtime.batch",
+            "description": (
+                "批量提交多天的加班申请：传日期列表 dates，或起止日期 start_date/end_date（含两端）。"
+                "各日期并发处理，返回逐日结果数组；未传 content 时每天各自读取日报并润色。"
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "dates": {
+                        "type": "array",
+                        "items": {"type": "string"},
+                        "description": "加班日期列表，格式为 YYYY-MM-DD",
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "区间开始日期，格式为 YYYY-MM-DD",
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "区间结束日期，格式为 YYYY-MM-DD",
+                    },
+                    "content": {
+                        "type": "string",
+                        "description": "可选，所有日期统一使用的加班内容；不传则逐日读取日报并润色",
+                    },
+                    "force": {
+                        "type": "boolean",
+                        "description": "可选，默认 false。为 true 时本地已成功提报的日期也重新提交（申请被驳回或撤回后使用），仍会逐日向后端校验",
+                    },
+                    "tenant": {
+                        "type": "string",
+                        "description": "可选，租户（员工）ID，对应 MCP_TENANTS_FILE 中的档案；不传则使用默认租户",
+                    },
+                },
+            },
+        },
+        {
+            "name": "overtime.summary",
+            "description": (
+                "查看已提报的加班汇总：逐日状态（success/exists/failed/skipped）与时长，以及按周、按月的加班小时合计。"
+                "数据来自本地记录，不访问上游接口。"
+            ),
+            "inputSchema": {
+                "type": "object",
+                "properties": {
+                    "month": {
+                        "type": "string",
+                        "description": "可选，月份，格式为 YYYY-MM；与 start_date/end_date 都不传时为本月",
+                    },
+                    "start_date": {
+                        "type": "string",
+                        "description": "可选，区间开始日期，格式为 YYYY-MM-DD",
+                    },
+                    "end_date": {
+                        "type": "string",
+                        "description": "可选，区间结束日期（含），格式为 YYYY-MM-DD",
+                    },
+                    "tenant": {
+                        "type": "string",
+                        "description": "可选，租户（员工）ID，对应 MCP_TENANTS_FILE 中的档案；不传则使用默认租户",
+                    },
+                },
+            },
+        },
+        {
+            "name": "metrics.get",
+            "description": "查看 MCP 运行指标：按工具、上游接口与结果（success/skipped/failed/401 等）统计的调用次数与延迟分布，以及各上游接口的自适应限流状态。",
+            "inputSchema": {"type": "object", "properties": {}},
+        }
+    ]
+
+
+def _text_result(message_id, payload) -> dict:
+    """把工具结果编码为 MCP 文本内容"""
+    with stage("response.encode"):
+        text_content = json.dumps(payload, ensure_ascii=False)
+    return {"jsonrpc": "2.0", "id": message_id, "result": {"content": [{"type": "text", "text": text_content}]}}
+
+
+def _call_tool(overtime_mcp: OvertimeMCP, message_id, name: str, arguments: dict, tenant_id: str = None):
+    """
+    执行 tools/call：按工具名路由到 MCP 调度方法
+    :return: (响应, 指标结果)
+    """
+    outcome = "success"
+    if name == "daily.get":
+        date = arguments.get("date")
+        daily_info = overtime_mcp.get_daily_report(date, tenant_id)
+        if "error" in daily_info:
+            outcome = "failed"
+        response = _text_result(message_id, daily_info)
+    elif name in ("overtime.submit", "overtime.auto"):
+        force = arguments.get("force", False)
+        if not isinstance(force, bool):
+            outcome = "error"
+            error = {"code": -32602, "message": "force 必须为布尔值"}
+            response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+        else:
+            date = arguments.get("date")
+            content = arguments.get("content")
+            task_result = overtime_mcp.dispatch_overtime_task(date, content, tenant_id, force)
+            outcome = task_result["task_status"]
+            response = _text_result(message_id, task_result)
+    elif name == "overtime.batch":
+        try:
+            force = arguments.get("force", False)
+            if not isinstance(force, bool):
+                raise ValueError("force 必须为布尔值")
+            batch_result = overtime_mcp.dispatch_overtime_batch(
+                arguments.get("dates"),
+                arguments.get("start_date"),
+                arguments.get("end_date"),
+                arguments.get("content"),
+                tenant_id,
+                force,
+            )
+        except ValueError as e:
+            outcome = "error"
+            error = {"code": -32602, "message": str(e)}
+            response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+        else:
+            outcome = "failed" if batch_result["summary"]["failed"] else "success"
+            response = _text_result(message_id, batch_result)
+    elif name == "overtime.summary":
+        summary = overtime_mcp.get_task(tenant_id).summary(
+            arguments.get("month"), arguments.get("start_date"), arguments.get("end_date")
+        )
+        response = _text_result(message_id, summary)
+    elif name == "metrics.get":
+        response = _text_result(message_id, dict(METRICS.snapshot(), rate_limiters=rate_limiter_snapshot()))
+    else:
+        outcome = "error"
+        error = {"code": -32601, "message": "Unknown tool name"}
+        response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+    return response, outcome
+
+
+def is_valid_request_id(request_id) -> bool:
+    """JSON-RPC 的 id 只能是字符串、数字或 null；数组、对象等既不能回显也不能作为登记的键"""
+    return request_id is None or (isinstance(request_id, (str, int, float)) and not isinstance(request_id, bool))
+
+
+def handle_message(overtime_mcp: OvertimeMCP, message: dict, notify=None, session_id: str = None):
+    """
+    处理单条 JSON-RPC 消息（stdio 与 HTTP 传输共用）
+    :param notify: 可选的通知回调 notify(level, message)，用于推送后台健康检查结果
+    :param session_id: HTTP 传输的会话 ID，用于区分不同客户端的请求 id
+    :return: (响应, 是否需要停止服务)；令牌过期时返回 True，由调用方关闭服务
+    """
+    message_id = message.get("id")
+    if not is_valid_request_id(message_id):
+        return _invalid_request(), False
+    method = message.get("method")
+    params = message.get("params") or {}
+    tenant_id = None
+    # 指标：tools/call 按工具名统计，其余按方法名；结果取任务状态或错误类型
+    started = time.perf_counter()
+    metric_name = method or "unknown"
+    outcome = "success"
+    fatal = False
+
+    try:
+        if method == "initialize":
+            # 健康检查放到后台，握手立即返回
+            overtime_mcp.start_health_check(notify)
+            protocol_version = params.get("protocolVersion", "2025-06-18")
+            result = {
+                "protocolVersion": protocol_version,
+                "serverInfo": {"name": "jabanmcp", "version": overtime_mcp.package_version},
+                "capabilities": {"tools": {}, "logging": {}},
+            }
+            overtime_mcp.logger.info("客户端初始化完成，MCP 版本：%s", overtime_mcp.package_version)
+            response = {"jsonrpc": "2.0", "id": message_id, "result": result}
+        elif method == "notifications/cancelled":
+            # 客户端放弃了某个在途请求：置位其取消信号，子任务在下一阶段开始前中止
+            request_id = params.get("requestId")
+            if overtime_mcp.cancel_request(request_id, session_id):
+                overtime_mcp.logger.info("请求 %s 已被客户端取消：%s", request_id, params.get("reason") or "未说明原因")
+            response = None
+        elif method == "tools/list":
+            tools = _tool_definitions()
+            response = {
+                "jsonrpc": "2.0",
+                "id": message_id,
+                "result": {"tools": tools},
+            }
+        elif method == "tools/call":
+            name = params.get("name")
+            arguments = dict(params.get("arguments") or {})
+            # _profile 为剖析开关，不属于工具参数
+            profile_requested = arguments.pop("_profile", None)
+            tenant_id = arguments.get("tenant")
+            metric_name = name or "unknown"
+            cancel_event = overtime_mcp.begin_request(message_id, session_id)
+            profile_session = None
+            try:
+                overtime_mcp.refresh_config_if_changed()
+                if is_truthy(profile_requested) or is_truthy(overtime_mcp.config.PROFILE):
+                    profile_session = ProfileSession(
+                        f"{name}-{message_id}", overtime_mcp.config.PROFILE_DIR, overtime_mcp.config.PROFILE_TOP
+                    )
+                # 取消信号与客户端声明的等待时长在整个工具调用内生效
+                with cancel_scope(cancel_event), deadline_scope(_client_timeout(params)), \
+                        (profile_session or nullcontext()):
+                    check_cancelled()
+                    token = overtime_mcp.current_token(tenant_id)
+                    try:
+                        if overtime_mcp.is_default_tenant(tenant_id):
+                            overtime_mcp.raise_if_token_expired()
+                        response, outcome = _call_tool(overtime_mcp, message_id, name, arguments, tenant_id)
+                    except TokenExpiredError:
+                        # 令牌过期：热更新令牌后原请求重试一次，仍失败时按令牌过期返回
+                        if not overtime_mcp.recover_token(tenant_id, token):
+                            raise
+                        overtime_mcp.logger.info("令牌已热更新，重试请求 %s（%s）", message_id, name)
+                        response, outcome = _call_tool(overtime_mcp, message_id, name, arguments, tenant_id)
+            finally:
+                overtime_mcp.end_request(message_id, session_id)
+                if profile_session is not None and profile_session.report_path:
+                    overtime_mcp.logger.info("请求 %s（%s）的性能剖析报告：%s", message_id, name, profile_session.report_path)
+            if profile_session is not None and profile_session.report_path and "result" in response:
+                response["result"]["_meta"] = {"profileReport": profile_session.report_path}
+        else:
+            outcome = "error"
+            error = {"code": -32601, "message": "Unknown method"}
+            response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+    except RequestCancelledError as e:
+        outcome = "cancelled"
+        error = {"code": REQUEST_CANCELLED_CODE, "message": str(e)}
+        response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+    except TokenExpiredError:
+        outcome = "401"
+        if overtime_mcp.is_default_tenant(tenant_id):
+            # 默认租户令牌过期：开启热更新时服务继续运行，更新 .env 后下一次调用即生效；
+            # 关闭热更新时沿用原有行为，返回错误后停止服务
+            fatal = not overtime_mcp.hot_reload_enabled
+            error = {"code": -40100, "message": "Token过期，请重新登录或更新 OVERTIME_API_TOKEN"}
+        else:
+            # 其他租户令牌过期只影响该租户，服务继续运行
+            error = {"code": -40100, "message": f"租户 {tenant_id} 的 Token 已过期，请更新租户档案中的 token"}
+        response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+    except ValueError as e:
+        # 参数错误（如租户不存在）
+        outcome = "error"
+        error = {"code": -32602, "message": str(e)}
+        response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+    except Exception as e:
+        outcome = "error"
+        error = {"code": -32000, "message": str(e)}
+        response = {"jsonrpc": "2.0", "id": message_id, "error": error}
+    METRICS.observe("tool", metric_name, outcome, time.perf_counter() - started)
+    return response, fatal
+
+
+def _invalid_request(message_id=None) -> dict:
+    return {"jsonrpc": "2.0", "id": message_id, "error": {"code": -32600, "message": "Invalid Request"}}
+
+
+def handle_batch(overtime_mcp: OvertimeMCP, messages: list, notify=None, session_id: str = None, handle=None):
+    """
+    处理 JSON-RPC 批量消息（数组）：同一批内的消息并行执行，响应按请求顺序汇总为一个数组
+    同批中的取消通知先于其他消息处理；通知与已取消的请求不产生响应
+    :param handle: 单条消息的处理函数，签名同 handle_message（HTTP 传输借此为工具调用占用处理名额）
+    :return: (响应数组，批内全部为通知时为 None；空数组按规范返回单个错误对象, 是否需要停止服务)
+    """
+    handle = handle or handle_message
+    if not messages:
+        return _invalid_request(), False
+    results = [None] * len(messages)
+    pending = []
+    for index, message in enumerate(messages):
+        if not isinstance(message, dict) or not is_valid_request_id(message.get("id")):
+            results[index] = (_invalid_request(), False)
+        elif message.get("method") == "notifications/cancelled":
+            handle(overtime_mcp, message, notify, session_id)
+        else:
+            if message.get("method") == "tools/call":
+                # 先登记全部工具调用，排队中尚未开始的请求同样可以被取消
+                overtime_mcp.begin_request(message.get("id"), session_id)
+            pending.append(index)
+
+    def run_one(index):
+        message = messages[index]
+        try:
+            return handle(overtime_mcp, message, notify, session_id)
+        finally:
+            if message.get("method") == "tools/call":
+                # 已登记但未进入 handle_message 就返回的调用（如被传输层按租户拒绝）同样注销
+                overtime_mcp.end_request(message.get("id"), session_id)
+
+    workers = min(len(pending), max(1, overtime_mcp.config.DISPATCH_WORKERS))
+    if workers <= 1:
+        for index in pending:
+            results[index] = run_one(index)
+    else:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mcp-batch") as executor:
+            futures = [(index, executor.submit(run_one, index)) for index in pending]
+            for index, future in futures:
+                results[index] = future.result()
+
+    responses = []
+    fatal = False
+    for message, result in zip(messages, results):
+        if result is None:
+            continue
+        response, item_fatal = result
+        fatal = fatal or item_fatal
+        if isinstance(message, dict) and message.get("id") is None and not item_fatal:
+            continue
+        if (response.get("error") or {}).get("code") == REQUEST_CANCELLED_CODE:
+            continue
+        responses.append(response)
+    return (responses or None), fatal
+
+
+def serve_stdio(overtime_mcp: OvertimeMCP):
+    """
+    stdio 并发调度：读线程只负责收消息，消息交给线程池并行处理，
+    响应按完成先后经单一加锁的写出函数输出（不保证与请求顺序一致）；
+    批量消息（JSON 数组）内部并行执行，全部完成后以一个数组一次写出
+    """
+    overtime_mcp.start_metrics_dump()
+    stop_event = threading.Event()
+    write_lock = threading.Lock()
+    inbox = queue.Queue()
+
+    def write_message(payload):
+        with write_lock:
+            if stop_event.is_set():
+                return
+            sys.stdout.write(json.dumps(payload, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+
+    def notify(level: str, data: str):
+        write_message({
+            "jsonrpc": "2.0",
+            "method": "notifications/message",
+            "params": {"level": level, "logger": "jabanmcp", "data": data},
+        })
+
+    def run_message(message: dict):
+        response, fatal = handle_message(overtime_mcp, message, notify)
+        if fatal:
+            # 令牌过期：写出错误后停止服务，其余在途请求的响应不再输出
+            write_message(response)
+            stop_event.set()
+        elif message.get("id") is not None:
+            # 已取消的请求不再回写响应（客户端已放弃该请求）
+            if (response.get("error") or {}).get("code") != REQUEST_CANCELLED_CODE:
+                write_message(response)
+
+    def run_batch(messages: list):
+        responses, fatal = handle_batch(overtime_mcp, messages, notify)
+        if responses is not None:
+            write_message(responses)
+        if fatal:
+            stop_event.set()
+
+    def dispatch_line(message):
+        if isinstance(message, list):
+            for item in message:
+                if isinstance(item, dict) and item.get("method") == "tools/call":
+                    overtime_mcp.begin_request(item.get("id"))
+            executor.submit(run_batch, message)
+            return
+        if not isinstance(message, dict) or not is_valid_request_id(message.get("id")):
+            write_message(_invalid_request())
+            return
+        if message.get("method") == "notifications/cancelled":
+            # 取消通知在读循环中直接处理，不排在繁忙的工作线程之后
+            handle_message(overtime_mcp, message, notify)
+            return
+        if message.get("method") == "tools/call":
+            # 入队即登记，排队中尚未开始的请求同样可以被取消
+            overtime_mcp.begin_request(message.get("id"))
+        executor.submit(run_message, message)
+
+    def read_stdin():
+        for line in sys.stdin:
+            inbox.put(line)
+        inbox.put(None)
+
+    threading.Thread(target=read_stdin, name="mcp-stdin", daemon=True).start()
+    executor = ThreadPoolExecutor(
+        max_workers=max(1, overtime_mcp.config.DISPATCH_WORKERS),
+        thread_name_prefix="mcp-dispatch",
+    )
+    while not stop_event.is_set():
+        try:
+            line = inbox.get(timeout=0.1)
+        except queue.Empty:
+            continue
+        if line is None:
+            break
+        text = line.strip()
+        if not text:
+            continue
+        try:
+            message = json.loads(text)
+        except json.JSONDecodeError:
+            continue
+        try:
+            dispatch_line(message)
+        except Exception as e:
+            # 单条消息的异常不能中断读循环，否则其他在途请求的响应全部丢失
+            overtime_mcp.logger.exception("处理消息失败：%s", e)
+            write_message(_invalid_request())
+
+    # stdin 关闭时等待在途请求完成；令牌过期时丢弃尚未开始的请求
+    stopped = stop_event.is_set()
+    executor.shutdown(wait=not stopped, cancel_futures=stopped)
+
+
 def main():
     overtime_mcp = OvertimeMCP(enable_console_log=True)
     args = sys.argv[1:]
+    if (args and args[0] == "--http") or os.getenv("MCP_TRANSPORT", "stdio").lower() == "http":
+        # HTTP 传输按需导入，stdio 模式的冷启动不受影响
+        from mcp_http import serve_http
+        host, port = None, None
+        if len(args) > 1 and args[0] == "--http":
+            bind_host, _, bind_port = args[1].rpartition(":")
+            host, port = bind_host or None, int(bind_port)
+        overtime_mcp.report_startup_time()
+        overtime_mcp.start_metrics_dump()
+        from scheduler import OvertimeScheduler, scheduler_enabled
+        if scheduler_enabled(overtime_mcp.config):
+            # 同一进程内顺带运行调度器，与 HTTP 客户端共享会话、缓存与台账
+            OvertimeScheduler(overtime_mcp).start()
+        try:
+            serve_http(overtime_mcp, handle_message, host, port, handle_batch)
+        except ValueError as e:
+            overtime_mcp.logger.error("HTTP 服务启动失败：%s", e)
+            overtime_mcp.close()
+            sys.exit(2)
+        overtime_mcp.close()
+        return
+    if args and args[0] == "--daemon":
+        # 常驻调度模式：代替每晚冷启动一次的外部 cron；--once 只执行一次规划后退出
+        from scheduler import OvertimeScheduler
+        scheduler = OvertimeScheduler(overtime_mcp)
+        overtime_mcp.report_startup_time()
+        if "--once" in args[1:]:
+            results = scheduler.run_pass()
+            sys.stdout.write(json.dumps(results, ensure_ascii=False) + "\n")
+            sys.stdout.flush()
+        else:
+            overtime_mcp.start_health_check()
+            overtime_mcp.start_metrics_dump()
+            signal.signal(signal.SIGTERM, lambda signum, frame: scheduler.stop())
+            try:
+                scheduler.run_forever()
+            except KeyboardInterrupt:
+                pass
+        overtime_mcp.close()
+        return
+    if args and args[0] == "--batch":
+        if len(args) < 2:
+            sys.stderr.write("用法：jabanmcp --batch 2026-01-05..2026-01-09 [加班内容]\n")
+            sys.exit(2)
+        content = " ".join(args[2:]) if len(args) > 2 else None
+        try:
+            result = overtime_mcp.dispatch_overtime_batch(overtime_content=content, **_parse_batch_arg(args[1]))
+        except ValueError as e:
+            result = {"task_type": "overtime_batch", "task_status": "failed", "message": str(e)}
+        sys.stdout.write(json.dumps(result, ensure_ascii=False) + "\n")
+        sys.stdout.flush()
+        return
     if args:
         date = args[0]
         content = " ".join(args[1:]) if len(args) > 1 else None
@@ -107,148 +968,9 @@ def main():
         sys.stdout.flush()
         return
 
-    for line in sys.stdin:
-        text = line.strip()
-        if not text:
-            continue
-        try:
-            message = json.loads(text)
-        except json.JSONDecodeError:
-            continue
-
-        message_id = message.get("id")
-        method = message.get("method")
-        params = message.get("params") or {}
-
-        try:
-            if method == "initialize":
-                ok = overtime_mcp.overtime_task.health_check_token()
-                if not ok:
-                    overtime_mcp.logger.warning("初始化阶段令牌健康检查失败（网络异常或非401），继续启动 MCP")
-                protocol_version = params.get("protocolVersion", "2025-06-18")
-                result = {
-                    "protocolVersion": protocol_version,
-                    "serverInfo": {"name": "jabanmcp", "version": overtime_mcp.package_version},
-                    "capabilities": {"tools": {}},
-                }
-                response = {"jsonrpc": "2.0", "id": message_id, "result": result}
-            elif method == "tools/list":
-                tools = [
-                    {
-                        "name": "daily.get",
-                        "description": "获取指定日期的日报内容。建议在调用 overtime.submit 之前先调用此工具获取日报，利用模型能力将日报内容润色为正式的加班申请理由。",
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "date": {
-                                    "type": "string",
-                                    "description": "日期，格式为 YYYY-MM-DD",
-                                }
-                            },
-                            "required": ["date"],
-                        },
-                    },
-                    {
-                        "name": "overtime.submit",
-                        "description": (
-                            "根据指定日期提交加班申请。"
-                            "支持单次调用：未提供content时将自动从日报获取并润色后提交。"
-                        ),
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "date": {
-                                    "type": "string",
-                                    "description": "加班日期，格式为 YYYY-MM-DD，例如 2025-12-25",
-                                },
-                                "content": {
-                                    "type": "string",
-                                    "description": "可选，经过模型润色后的加班内容。建议提供此参数以获得更好的提报质量。不要出现'工作内容润色：依据','加班时间','提报目的','根据','日报','项目编号'等字眼。这就是个简短加班内容, 主要为了修改bug才加班",
-                                },
-                            },
-                            "required": ["date"],
-                        },
-                    },
-                    {
-                        "name": "overtime.auto",
-                        "description": (
-                            "一次调用完成加班申请：只传日期即可。"
-                            "如未传 content，将自动读取当日日报并润色后提交。"
-                        ),
-                        "inputSchema": {
-                            "type": "object",
-                            "properties": {
-                                "date": {
-                                    "type": "string",
-                                    "description": "加班日期，格式为 YYYY-MM-DD",
-                                },
-                                "content": {
-                                    "type": "string",
-                                    "description": "可选，自定义加班内容；不传则自动读取日报并润色",
-                                },
-                            },
-                            "required": ["date"],
-                        },
-                    }
-                ]
-                response = {
-                    "jsonrpc": "2.0",
-                    "id": message_id,
-                    "result": {"tools": tools},
-                }
-            elif method == "tools/call":
-                name = params.get("name")
-                arguments = params.get("arguments") or {}
-
-                if name == "daily.get":
-                    date = arguments.get("date")
-                    daily_info = overtime_mcp.overtime_task.get_daily_report(date)
-                    text_content = json.dumps(daily_info, ensure_ascii=False)
-                    result = {
-                        "content": [{"type": "text", "text": text_content}]
-                    }
-                    response = {"jsonrpc": "2.0", "id": message_id, "result": result}
-                elif name == "overtime.submit":
-                    date = arguments.get("date")
-                    content = arguments.get("content")
-                    task_result = overtime_mcp.dispatch_overtime_task(date, content)
-                    text_content = json.dumps(task_result, ensure_ascii=False)
-                    result = {
-                        "content": [
-                            {"type": "text", "text": text_content},
-                        ]
-                    }
-                    response = {"jsonrpc": "2.0", "id": message_id, "result": result}
-                elif name == "overtime.auto":
-                    date = arguments.get("date")
-                    content = arguments.get("content")
-                    task_result = overtime_mcp.dispatch_overtime_task(date, content)
-                    text_content = json.dumps(task_result, ensure_ascii=False)
-                    result = {
-                        "content": [
-                            {"type": "text", "text": text_content},
-                        ]
-                    }
-                    response = {"jsonrpc": "2.0", "id": message_id, "result": result}
-                else:
-                    error = {"code": -32601, "message": "Unknown tool name"}
-                    response = {"jsonrpc": "2.0", "id": message_id, "error": error}
-            else:
-                error = {"code": -32601, "message": "Unknown method"}
-                response = {"jsonrpc": "2.0", "id": message_id, "error": error}
-        except TokenExpiredError:
-            error = {"code": -40100, "message": "Token过期，请重新登录或更新 OVERTIME_API_TOKEN"}
-            response = {"jsonrpc": "2.0", "id": message_id, "error": error}
-            sys.stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
-            sys.stdout.flush()
-            break
-        except Exception as e:
-            error = {"code": -32000, "message": str(e)}
-            response = {"jsonrpc": "2.0", "id": message_id, "error": error}
-
-        if message_id is not None:
-            sys.stdout.write(json.dumps(response, ensure_ascii=False) + "\n")
-            sys.stdout.flush()
+    overtime_mcp.report_startup_time()
+    serve_stdio(overtime_mcp)
+    overtime_mcp.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,364 @@
+# mcp_http.py - MCP Streamable HTTP 传输：一个常驻进程同时服务多个客户端，共享上游连接池、日报缓存与台账
+import hmac
+import json
+import time
+import uuid
+import queue
+import signal
+import ipaddress
+import threading
+from contextlib import nullcontext
+from urllib.parse import urlsplit
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from tenants import DEFAULT_TENANT_ID
+
+# 本机来源始终允许（防 DNS 重绑定：浏览器页面不能借本机端口调用 MCP）
+_LOCAL_HOSTS = ("localhost", "127.0.0.1", "[::1]", "::1")
+# SSE 长连接的保活间隔（秒）
+_SSE_PING_INTERVAL = 15
+
+
+def is_loopback_host(host: str) -> bool:
+    if host in _LOCAL_HOSTS:
+        return True
+    try:
+        return ipaddress.ip_address(host.strip("[]")).is_loopback
+    except ValueError:
+        return False
+
+
+def has_http_secrets(overtime_mcp) -> bool:
+    return any(profile.http_secret for profile in overtime_mcp.tenants.values())
+
+
+class MCPSession:
+    """
+    一个 MCP 客户端会话：initialize 时创建并绑定到凭据对应的租户，
+    服务端推送的通知经 outbox 由 GET 流输出
+    """
+    def __init__(self, tenant_id: str = DEFAULT_TENANT_ID):
+        self.session_id = uuid.uuid4().hex
+        self.tenant_id = tenant_id
+        self.outbox = queue.Queue()
+        self.last_seen = time.monotonic()
+        self.closed = threading.Event()
+
+    def touch(self):
+        self.last_seen = time.monotonic()
+
+    def notify(self, level: str, data: str):
+        self.outbox.put({
+            "jsonrpc": "2.0",
+            "method": "notifications/message",
+            "params": {"level": level, "logger": "jabanmcp", "data": data},
+        })
+
+
+class MCPHttpServer(ThreadingHTTPServer):
+    """每个连接一个线程；所有会话共用同一个 OvertimeMCP（同一组租户子任务）"""
+    daemon_threads = True
+    # 多个客户端同时建连时默认的 listen 队列（5）会被打满导致连接被重置
+    request_queue_size = 128
+
+    def __init__(self, address, overtime_mcp, handle_message, handle_batch=None):
+        super().__init__(address, MCPHttpHandler)
+        self.overtime_mcp = overtime_mcp
+        self.handle_message = handle_message
+        self.handle_batch = handle_batch
+        config = overtime_mcp.config
+        self.path = config.HTTP_PATH
+        self.loopback = is_loopback_host(str(self.server_address[0]))
+        self.session_ttl = config.HTTP_SESSION_TTL
+        self.allowed_origins = {o.strip().rstrip("/") for o in config.HTTP_ALLOWED_ORIGINS.split(",") if o.strip()}
+        # 所有客户端合计同时处理的工具调用数受 HTTP_WORKERS 限制，多出的请求排队
+        self.slots = threading.BoundedSemaphore(max(1, config.HTTP_WORKERS))
+        self.stopping = threading.Event()
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
+
+    def resolve_tenant(self, authorization: str):
+        """
+        按 Authorization: Bearer <密钥> 确定请求所属的租户，鉴权失败返回 None
+        没有任何租户配置密钥时，只有监听本机的服务可以访问，且只能使用默认租户
+        """
+        secrets = [
+            (tenant_id, profile.http_secret)
+            for tenant_id, profile in self.overtime_mcp.tenants.items() if profile.http_secret
+        ]
+        if not secrets:
+            return DEFAULT_TENANT_ID if self.loopback else None
+        scheme, _, credential = (authorization or "").strip().partition(" ")
+        credential = credential.strip().encode("utf-8")
+        if scheme.lower() != "bearer" or not credential:
+            return None
+        for tenant_id, secret in secrets:
+            if hmac.compare_digest(str(secret).encode("utf-8"), credential):
+                return tenant_id
+        return None
+
+    def create_session(self, tenant_id: str = DEFAULT_TENANT_ID) -> MCPSession:
+        session = MCPSession(tenant_id)
+        with self._sessions_lock:
+            # 顺带清理空闲过期的会话
+            now = time.monotonic()
+            for session_id, old in list(self._sessions.items()):
+                if now - old.last_seen > self.session_ttl:
+                    old.closed.set()
+                    del self._sessions[session_id]
+            self._sessions[session.session_id] = session
+        return session
+
+    def get_session(self, session_id: str):
+        with self._sessions_lock:
+            session = self._sessions.get(session_id)
+        if session is not None:
+            session.touch()
+        return session
+
+    def close_session(self, session_id: str) -> bool:
+        with self._sessions_lock:
+            session = self._sessions.pop(session_id, None)
+        if session is None:
+            return False
+        session.closed.set()
+        return True
+
+    def stop(self):
+        """停止服务：收到 SIGTERM，或令牌过期且关闭了热更新时（与 stdio 模式行为一致）"""
+        self.stopping.set()
+        threading.Thread(target=self.shutdown, name="mcp-http-shutdown", daemon=True).start()
+
+
+class MCPHttpHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        self.server.overtime_mcp.logger.debug("HTTP %s - %s", self.address_string(), format % args)
+
+    def _reply(self, status: int, payload=None, headers: dict = None):
+        data = b"" if payload is None else json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        if payload is not None:
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        if data:
+            self.wfile.write(data)
+
+    def _reply_error(self, status: int, code: int, message: str):
+        self._reply(status, {"jsonrpc": "2.0", "id": None, "error": {"code": code, "message": message}})
+
+    def _check_request(self) -> bool:
+        """校验路径与来源，失败时已写出错误响应"""
+        if urlsplit(self.path).path != self.server.path:
+            self._reply(404, {"message": "not found"})
+            return False
+        origin = self.headers.get("Origin")
+        if origin:
+            origin = origin.rstrip("/")
+            host = urlsplit(origin).hostname or ""
+            if host not in _LOCAL_HOSTS and origin not in self.server.allowed_origins:
+                self._reply(403, {"message": "origin not allowed"})
+                return False
+        # 来源校验只防浏览器页面；本机其他进程与局域网主机需凭密钥确定能以哪个租户提报
+        self.tenant_id = self.server.resolve_tenant(self.headers.get("Authorization"))
+        if self.tenant_id is None:
+            self._reply(401, {"message": "unauthorized"}, {"WWW-Authenticate": 'Bearer realm="jabanmcp"'})
+            return False
+        return True
+
+    def _session_from_header(self):
+        """
+        按 Mcp-Session-Id 取会话；缺失返回 400，未知或已过期返回 404（客户端应重新 initialize），
+        会话属于其他租户的凭据时返回 403
+        """
+        session_id = self.headers.get("Mcp-Session-Id")
+        if not session_id:
+            self._reply_error(400, -32600, "缺少 Mcp-Session-Id 请求头")
+            return None
+        session = self.server.get_session(session_id)
+        if session is None:
+            self._reply_error(404, -32600, "会话不存在或已过期，请重新 initialize")
+        elif session.tenant_id != self.tenant_id:
+            self._reply_error(403, -32600, "会话不属于当前凭据")
+            return None
+        return session
+
+    def _scope_to_tenant(self, message: dict):
+        """
+        工具调用限定在会话绑定的租户：未指定 tenant 时补上，指定了其他租户时拒绝
+        :return: (改写后的消息, 拒绝时的错误响应)
+        """
+        if message.get("method") != "tools/call" or not isinstance(message.get("params"), dict):
+            return message, None
+        params = message["params"]
+        arguments = params.get("arguments") if isinstance(params.get("arguments"), dict) else {}
+        requested = arguments.get("tenant") or self.tenant_id
+        if requested != self.tenant_id:
+            error = {"code": -32602, "message": f"当前凭据无权使用租户：{requested}"}
+            return None, {"jsonrpc": "2.0", "id": message.get("id"), "error": error}
+        if self.tenant_id != DEFAULT_TENANT_ID:
+            message = dict(message, params=dict(params, arguments=dict(arguments, tenant=self.tenant_id)))
+        return message, None
+
+    def do_POST(self):
+        if not self._check_request():
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            message = json.loads(raw or b"null")
+        except ValueError:
+            self._reply_error(400, -32700, "Parse error")
+            return
+        if isinstance(message, list) and self.server.handle_batch is not None:
+            self._handle_batch(message)
+            return
+        if not isinstance(message, dict):
+            self._reply_error(400, -32600, "Invalid Request")
+            return
+
+        headers = {}
+        if message.get("method") == "initialize":
+            session = self.server.create_session(self.tenant_id)
+            headers["Mcp-Session-Id"] = session.session_id
+        else:
+            session = self._session_from_header()
+            if session is None:
+                return
+
+        if "id" not in message or "method" not in message:
+            # 通知（如 notifications/cancelled）或客户端对服务端请求的响应：处理后返回 202，无响应体
+            # 通知形式的 tools/call 同样经过租户限定，不能借此绕过会话绑定的租户
+            if "method" in message:
+                self._handle_with_slot(self.server.overtime_mcp, message, session.notify, session.session_id)
+            self._reply(202, headers=headers)
+            return
+
+        response, fatal = self._handle_with_slot(
+            self.server.overtime_mcp, message, session.notify, session.session_id
+        )
+        self._reply_response(response, headers)
+        if fatal:
+            self.server.stop()
+
+    def _handle_with_slot(self, overtime_mcp, message: dict, notify, session_id: str):
+        """只有工具调用占用处理名额，initialize / tools/list 等轻量请求不排队"""
+        message, denied = self._scope_to_tenant(message)
+        if denied is not None:
+            return denied, False
+        slot = self.server.slots if message.get("method") == "tools/call" else nullcontext()
+        with slot:
+            return self.server.handle_message(overtime_mcp, message, notify, session_id)
+
+    def _handle_batch(self, messages: list):
+        """批量消息：批内各消息并行执行（工具调用各自占用处理名额），响应按请求顺序以一个数组返回"""
+        headers = {}
+        if any(isinstance(m, dict) and m.get("method") == "initialize" for m in messages):
+            session = self.server.create_session(self.tenant_id)
+            headers["Mcp-Session-Id"] = session.session_id
+        else:
+            session = self._session_from_header()
+            if session is None:
+                return
+        responses, fatal = self.server.handle_batch(
+            self.server.overtime_mcp, messages, session.notify, session.session_id, self._handle_with_slot
+        )
+        if responses is None:
+            # 批内全部为通知
+            self._reply(202, headers=headers)
+        else:
+            self._reply_response(responses, headers)
+        if fatal:
+            self.server.stop()
+
+    def _reply_response(self, response, headers: dict):
+        accept = self.headers.get("Accept") or ""
+        if "text/event-stream" in accept and "application/json" not in accept:
+            self._reply_sse(response, headers)
+        else:
+            self._reply(200, response, headers)
+
+    def _reply_sse(self, response, headers: dict):
+        """只接受 SSE 的客户端：以单个事件返回响应后结束流"""
+        data = f"event: message\ndata: {json.dumps(response, ensure_ascii=False)}\n\n".encode("utf-8")
+        self.send_response(200)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        """服务端推送流：输出该会话的通知（如后台令牌检查结果），空闲时发送保活注释"""
+        if not self._check_request():
+            return
+        if "text/event-stream" not in (self.headers.get("Accept") or ""):
+            self._reply(405, {"message": "GET 仅用于 text/event-stream"}, {"Allow": "POST, GET, DELETE"})
+            return
+        session = self._session_from_header()
+        if session is None:
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream; charset=utf-8")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+        try:
+            while not (session.closed.is_set() or self.server.stopping.is_set()):
+                try:
+                    payload = session.outbox.get(timeout=_SSE_PING_INTERVAL)
+                    chunk = f"event: message\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
+                except queue.Empty:
+                    chunk = ": ping\n\n"
+                self.wfile.write(chunk.encode("utf-8"))
+                self.wfile.flush()
+                session.touch()
+        except OSError:
+            # 客户端断开推送流，会话仍然有效
+            pass
+
+    def do_DELETE(self):
+        """客户端主动结束会话"""
+        if not self._check_request():
+            return
+        session_id = self.headers.get("Mcp-Session-Id")
+        session = self.server.get_session(session_id) if session_id else None
+        if session is None or session.tenant_id != self.tenant_id or not self.server.close_session(session_id):
+            self._reply(404, {"message": "session not found"})
+            return
+        self._reply(204)
+
+
+def serve_http(overtime_mcp, handle_message, host: str = None, port: int = None, handle_batch=None):
+    """
+    以 Streamable HTTP 方式提供 MCP 服务，阻塞直到进程被中断或令牌过期停止服务
+    :param handle_message: JSON-RPC 消息处理函数（与 stdio 模式共用同一套工具调度）
+    :param handle_batch: JSON-RPC 批量消息处理函数，不传时批量请求返回 400
+    :raises ValueError: 监听非本机地址但没有配置任何访问密钥
+    """
+    config = overtime_mcp.config
+    port = config.HTTP_PORT if port is None else port
+    host = host or config.HTTP_HOST
+    if not is_loopback_host(host) and not has_http_secrets(overtime_mcp):
+        raise ValueError(
+            f"监听非本机地址 {host} 需要先配置访问密钥（MCP_HTTP_SECRET 或租户档案中的 http_secret）"
+        )
+    server = MCPHttpServer((host, port), overtime_mcp, handle_message, handle_batch)
+    bound_host, bound_port = server.server_address[:2]
+    overtime_mcp.logger.info("MCP HTTP 服务已启动：http://%s:%s%s", bound_host, bound_port, server.path)
+    if threading.current_thread() is threading.main_thread():
+        # SIGTERM 时正常退出，调用方得以释放连接池并写完日志
+        signal.signal(signal.SIGTERM, lambda signum, frame: server.stop())
+    try:
+        server.serve_forever(poll_interval=0.2)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.stopping.set()
+        server.server_close()
@@ -0,0 +1,58 @@
+# mcp_logging.py - MCP 日志基础设施：队列异步写日志、按大小/时间轮转、可选 JSONL 结构化输出
+import json
+import logging
+import queue
+from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler, TimedRotatingFileHandler
+
+
+class DeferredQueueHandler(QueueHandler):
+    """
+    只把日志记录放入队列的 Handler：消息格式化（含 %r 等参数展开）推迟到后台写线程，
+    请求线程上不做任何格式化和磁盘 IO
+    """
+    def prepare(self, record):
+        return record
+
+
+class JsonLineFormatter(logging.Formatter):
+    """JSONL 结构化日志：每条日志一行 JSON，便于检索与采集"""
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created).strftime("%Y-%m-%d %H:%M:%S.%f")[:-3],
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False)
+
+
+def build_file_handler(config):
+    """按配置创建日志文件 Handler：size 按文件大小轮转，time 按时间轮转"""
+    if str(config.LOG_ROTATE).lower() == "time":
+        return TimedRotatingFileHandler(
+            config.LOG_FILE,
+            when=config.LOG_ROTATE_WHEN,
+            backupCount=config.LOG_BACKUP_COUNT,
+            encoding="utf-8",
+            errors="replace",
+        )
+    return RotatingFileHandler(
+        config.LOG_FILE,
+        maxBytes=config.LOG_MAX_BYTES,
+        backupCount=config.LOG_BACKUP_COUNT,
+        encoding="utf-8",
+        errors="replace",
+    )
+
+
+def start_queue_logging(logger: logging.Logger, handlers: list) -> QueueListener:
+    """把真实 Handler 挂到后台 QueueListener 上，logger 只保留一个入队 Handler"""
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(DeferredQueueHandler(log_queue))
+    listener = QueueListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    return listener
@@ -0,0 +1,100 @@
+# metrics.py - 进程内指标：按工具 / 上游接口 / 结果统计调用次数与延迟直方图
+import threading
+import time
+
+# 延迟直方图桶上界（毫秒），最后一个桶收纳所有更慢的调用
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+
+class LatencyHistogram:
+    """固定桶延迟直方图：记录次数、总耗时、最大值，分位数按桶上界估算"""
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+
+    def observe(self, elapsed_ms: float):
+        self.count += 1
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+        for index, bound in enumerate(LATENCY_BUCKETS_MS):
+            if elapsed_ms <= bound:
+                self.buckets[index] += 1
+                return
+        self.buckets[-1] += 1
+
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for index, bucket_count in enumerate(self.buckets):
+            seen += bucket_count
+            if seen >= target:
+                # 桶上界只是估计值，不会超过实际观测到的最大值
+                if index < len(LATENCY_BUCKETS_MS):
+                    return min(float(LATENCY_BUCKETS_MS[index]), round(self.max_ms, 2))
+                return round(self.max_ms, 2)
+        return round(self.max_ms, 2)
+
+    def snapshot(self) -> dict:
+        return {
+            "count": self.count,
+            "avg_ms": round(self.total_ms / self.count, 2) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50),
+            "p95_ms": self.quantile(0.95),
+            "p99_ms": self.quantile(0.99),
+            "max_ms": round(self.max_ms, 2),
+            "buckets": {
+                **{f"le_{bound}": n for bound, n in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                "inf": self.buckets[-1],
+            },
+        }
+
+
+class MetricsRegistry:
+    """
+    指标注册表：按（类别, 名称, 结果）聚合，线程安全
+    类别 tool 为 JSON-RPC 调度（工具名或方法名），upstream 为上游接口
+    """
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self.started_at = time.time()
+
+    def observe(self, kind: str, name: str, outcome: str, elapsed_seconds: float):
+        key = (kind, name, outcome)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = LatencyHistogram()
+            histogram.observe(elapsed_seconds * 1000)
+
+    def snapshot(self) -> dict:
+        result = {"uptime_seconds": round(time.time() - self.started_at, 1), "tool": {}, "upstream": {}}
+        with self._lock:
+            for (kind, name, outcome), histogram in sorted(self._histograms.items()):
+                result.setdefault(kind, {}).setdefault(name, {})[outcome] = histogram.snapshot()
+        return result
+
+    def summary_lines(self) -> list:
+        """每个（类别, 名称, 结果）一行的简要汇总，供定期写日志"""
+        lines = []
+        with self._lock:
+            for (kind, name, outcome), histogram in sorted(self._histograms.items()):
+                lines.append(
+                    f"{kind}:{name}:{outcome} count={histogram.count} "
+                    f"p50={histogram.quantile(0.50):.0f}ms p95={histogram.quantile(0.95):.0f}ms "
+                    f"max={histogram.max_ms:.0f}ms"
+                )
+        return lines
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+            self.started_at = time.time()
+
+
+# 进程级共享的指标注册表：MCP 调度层与上游调用层都写入这里
+REGISTRY = MetricsRegistry()
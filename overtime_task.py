@@ -1,21 +1,77 @@
 # overtime_task.py - 加班提报子任务，MCP 不直接处理接口，只调度该任务
-try:
-    import requests as _requests
-except Exception:
-    _requests = None
+import os
 import json
+import contextvars
 import base64
-from datetime import datetime
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
 from config import MCPGlobalConfig
+from upstream import build_timeout, is_truthy, pool_capacity
+from transport import UPSTREAM_FAKE, build_transport, upstream_backend
+from metrics import REGISTRY as METRICS
+from resilience import (
+    LIMIT_IGNORE,
+    CircuitOpenError,
+    DeadlineExceededError,
+    RequestCancelledError,
+    budget_exhausted,
+    check_cancelled,
+    clamp_timeout,
+    get_circuit_breaker,
+    get_rate_limiter,
+    is_cancelled,
+    limit_outcome,
+    remaining_time,
+    retry_call,
+)
+from concurrency import SingleFlight
+from daily_store import DailyReportCache, DailyReportStore
+from profiling import stage
+from work_calendar import WORKING_DAY_TYPES, get_work_calendar
+from exist_index import OvertimeIntervalIndex
+from ledger import (
+    SubmissionLedger,
+    STATUS_PENDING,
+    STATUS_UNKNOWN,
+    STATUS_SUCCESS,
+    STATUS_EXISTS,
+    SUMMARY_FAILED,
+    SUMMARY_SKIPPED,
+    overtime_hours,
+)
+from tenants import TenantProfile, DEFAULT_TENANT_ID
 
 class TokenExpiredError(Exception):
     pass
 
 class OvertimeSubmitTask:
-    """加班提报子任务（MCP 下属执行单元）"""
-    def __init__(self):
+    """加班提报子任务（MCP 下属执行单元），每个租户一个实例，会话、缓存与台账互相隔离"""
+    def __init__(self, tenant: TenantProfile = None):
         self.config = MCPGlobalConfig()
+        self.tenant = tenant or TenantProfile(DEFAULT_TENANT_ID, self.config)
         self.headers = self._build_request_headers()
+        self._init_endpoints()
+        # 子任务持有的上游传输（live 时为长连接会话）：所有上游调用共用同一连接池，首次使用时才创建
+        self._transport = None
+        self._transport_ready = False
+        self._transport_lock = threading.Lock()
+        self._transport_key = self._build_transport_key()
+        self.timeout = build_timeout(self.config)
+        self.breaker = get_circuit_breaker(self.base_url, self.config)
+        self.daily_cache = DailyReportCache(self.config.DAILY_CACHE_TTL, self.config.DAILY_CACHE_SIZE)
+        self.exist_index = OvertimeIntervalIndex(self.config.EXIST_INDEX_TTL)
+        # 仿真后端（fake）使用内存台账与日报存储，不污染真实提报记录
+        ledger_path = ":memory:" if self.is_fake_upstream else self._tenant_file(self.config.LEDGER_FILE)
+        self.ledger = SubmissionLedger(ledger_path)
+        store_path = ":memory:" if self.is_fake_upstream else self._tenant_file(self.config.DAILY_STORE_FILE)
+        self.daily_store = DailyReportStore(store_path)
+        # 在途请求合并：同一租户（每租户一个子任务实例）同一日期的并发查询 / 提报只向上游发一次
+        self.inflight = SingleFlight()
+        self._payload_template = self._build_payload_template()
+
+    def _init_endpoints(self):
         raw_base_url = (self.config.API_URL or "").strip().rstrip("/")
         if raw_base_url and not raw_base_url.startswith(("http://", "https://")):
             raw_base_url = "https://" + raw_base_url.lstrip("/")
@@ -24,14 +80,75 @@ class OvertimeSubmitTask:
         self.start_flow_url = f"{self.base_url}/runtime/instance/v1/start"
         self.daily_list_url = f"{self.base_url}/form/dataTemplate/v1/listJson"
 
-    def _is_simulate(self) -> bool:
-        v = getattr(self.config, "SIMULATE", "0")
-        return str(v).lower() in ("1", "true", "yes")
+    def _build_transport_key(self) -> tuple:
+        """决定上游传输能否沿用的配置：后端、上游地址与连接池参数不变时热更新只需替换请求头"""
+        return (
+            upstream_backend(self.config), self.config.CASSETTE_FILE,
+            self.base_url, pool_capacity(self.config), self.config.POOL_BLOCK, self.config.HTTP_KEEP_ALIVE,
+        )
+
+    def apply_profile(self, tenant: TenantProfile):
+        """
+        令牌或配置热更新：原地重建请求头、上游地址、超时与报文模板，不重启进程
+        连接池参数与上游地址未变时只替换会话请求头，保留已建立的热连接
+        """
+        old_base_url = self.base_url
+        self.tenant = tenant
+        self.headers = self._build_request_headers()
+        self._init_endpoints()
+        self.timeout = build_timeout(self.config)
+        self.breaker = get_circuit_breaker(self.base_url, self.config)
+        self._payload_template = self._build_payload_template()
+        transport_key = self._build_transport_key()
+        with self._transport_lock:
+            if transport_key != self._transport_key:
+                # 旧会话可能仍有在途请求，不主动关闭，由垃圾回收释放
+                self._transport = None
+                self._transport_ready = False
+                self._transport_key = transport_key
+            elif self._transport is not None:
+                self._transport.update_headers(self.headers)
+        if self.base_url != old_base_url:
+            # 换了上游后缓存内容不再可信
+            self.daily_cache.invalidate()
+            self.daily_store.clear()
+            self.exist_index.clear()
+
+    def _tenant_file(self, path: str) -> str:
+        """按租户区分本地文件：overtime_ledger.db -> overtime_ledger_<租户>.db"""
+        root, ext = os.path.splitext(path)
+        return f"{root}{self.tenant.storage_suffix}{ext}"
+
+    @property
+    def transport(self):
+        """
+        上游传输（按需创建）：冷启动不导入 requests，首次上游调用或后台预热时建立
+        后端由 MCP_UPSTREAM 决定（live / fake / record / replay）；live 时 requests 未安装返回 None
+        """
+        if not self._transport_ready:
+            with self._transport_lock:
+                if not self._transport_ready:
+                    self._transport = build_transport(
+                        self.config, self.headers, self._tenant_file(self.config.CASSETTE_FILE)
+                    )
+                    self._transport_ready = True
+        return self._transport
+
+    @property
+    def is_fake_upstream(self) -> bool:
+        return upstream_backend(self.config) == UPSTREAM_FAKE
+
+    def close(self):
+        """释放连接池（MCP 退出时调用）"""
+        if self._transport is not None:
+            self._transport.close()
+        self.ledger.close()
+        self.daily_store.close()
 
     def _build_request_headers(self):
         """构建请求头（子任务内部辅助方法，被 MCP 调度时自动调用）"""
         return {
-            "Authorization": f"Bearer {self.config.API_TOKEN}",
+            "Authorization": f"Bearer {self.tenant.token}",
             "Content-Type": "application/json; charset=utf-8",
             "User-Agent": "OvertimeMCP/1.0.0"
         }
@@ -44,6 +161,18 @@ class OvertimeSubmitTask:
         except ValueError:
             return False
 
+    @property
+    def calendar(self):
+        """工作日历（节假日数据文件修改后自动重新加载）"""
+        return get_work_calendar(self.config)
+
+    def working_dates(self, dates: list) -> list:
+        """过滤掉周末与节假日，只保留需要提报的日期；关闭 SKIP_NON_WORKDAYS 时原样返回"""
+        if not is_truthy(self.config.SKIP_NON_WORKDAYS):
+            return list(dates)
+        calendar = self.calendar
+        return [d for d in dates if not self._validate_overtime_date(d) or calendar.is_workday(d)]
+
     def _build_datetime_range(self, overtime_date: str):
         start_time = f"{overtime_date} {self.config.FIXED_OVERTIME_START}"
         end_time = f"{overtime_date} {self.config.FIXED_OVERTIME_END}"
@@ -51,13 +180,100 @@ class OvertimeSubmitTask:
 
     def _handle_response(self, response):
         if getattr(response, "status_code", None) == 401:
+            # 令牌失效时缓存内容不再可信，必须显式清空
+            self.daily_cache.invalidate()
+            self.exist_index.clear()
             raise TokenExpiredError("Token 已过期")
         response.raise_for_status()
 
+    def _post(self, url: str, body: dict, idempotent: bool = False):
+        """
+        统一的上游 POST 调用：复用会话连接池，连接/读取超时分开控制
+        :param idempotent: 幂等请求（查询类）在网络异常、超时或 5xx 时按退避策略重试；发起流程不重试
+        """
+        if self.transport is None:
+            raise RuntimeError("requests 未安装")
+        endpoint = url.rsplit("/", 1)[-1]
+        attempts = self.config.RETRY_ATTEMPTS if idempotent else 1
+        return retry_call(
+            lambda: self._post_once(url, body, endpoint),
+            attempts,
+            self.config.RETRY_BASE_DELAY,
+            self.config.RETRY_MAX_DELAY,
+        )
+
+    def _rate_limiter(self, endpoint: str):
+        if not is_truthy(self.config.RATE_LIMIT):
+            return None
+        return get_rate_limiter(f"{self.base_url} {endpoint}", self.config)
+
+    def _post_once(self, url: str, body: dict, endpoint: str):
+        """单次上游请求：经熔断器与自适应限流放行，超时压缩到本次工具调用的剩余预算内"""
+        started = time.perf_counter()
+        outcome = "failed"
+        try:
+            check_cancelled()
+            # 先等限流名额再过熔断器：排队超时不会占住半开状态的探测名额
+            limiter = self._rate_limiter(endpoint)
+            if limiter is not None:
+                with stage("ratelimit.wait"):
+                    acquired_at = limiter.acquire()
+            limit_result = LIMIT_IGNORE
+            sent_at = None
+            try:
+                # 排队等待限流名额之后再计算超时，等待时间同样计入总预算；
+                # 预算已耗尽时在过熔断器之前失败，不会占住半开状态的探测名额
+                timeout = clamp_timeout(self.timeout)
+                probe = self.breaker.before_call()
+                reported = False
+                try:
+                    with stage(f"upstream.{endpoint}"):
+                        response = self.transport.post(url, body, timeout)
+                    sent_at = getattr(response, "sent_at", None)
+                    limit_result = limit_outcome(response=response)
+                    # 只有 5xx 说明上游不健康；401 等 4xx 说明主机可用
+                    if response.status_code >= 500:
+                        self.breaker.record_failure()
+                    else:
+                        self.breaker.record_success()
+                    reported = True
+                except Exception as e:
+                    if timeout != self.timeout and getattr(e, "response", None) is None and budget_exhausted():
+                        # 超时被调用方的预算（_meta.timeoutMs 等）压缩后触发：与 DeadlineExceededError 同样处理，
+                        # 不计入按主机共享的熔断器与限流器，单个调用方的短预算不会影响其他客户端与租户
+                        outcome = "deadline"
+                    else:
+                        limit_result = limit_outcome(error=e)
+                        self.breaker.record_failure()
+                        reported = True
+                    raise
+                finally:
+                    if not reported:
+                        self.breaker.release(probe)
+            finally:
+                if limiter is not None:
+                    # 延迟从拿到连接后发出请求算起，连接池排队不会被误判为上游排队而压低并发上限
+                    limiter.release(sent_at or acquired_at, limit_result)
+            self._handle_response(response)
+            outcome = "success"
+            return response
+        except TokenExpiredError:
+            outcome = "401"
+            raise
+        except CircuitOpenError:
+            outcome = "circuit_open"
+            raise
+        except DeadlineExceededError:
+            outcome = "deadline"
+            raise
+        except RequestCancelledError:
+            outcome = "cancelled"
+            raise
+        finally:
+            METRICS.observe("upstream", endpoint, outcome, time.perf_counter() - started)
+
     def health_check_token(self) -> bool:
-        if self._is_simulate():
-            return True
-        if _requests is None:
+        if self.transport is None:
             return False
         body = {
             "templateId": self.config.DAILY_TEMPLATE_ID,
@@ -68,13 +284,7 @@ class OvertimeSubmitTask:
             },
         }
         try:
-            response = _requests.post(
-                url=self.daily_list_url,
-                json=body,
-                headers=self.headers,
-                timeout=self.config.REQUEST_TIMEOUT,
-            )
-            self._handle_response(response)
+            self._post(self.daily_list_url, body, idempotent=True)
             return True
         except TokenExpiredError:
             raise
@@ -82,74 +292,151 @@ class OvertimeSubmitTask:
             return False
 
     def _request_valid_exist(self, start_time: str, end_time: str):
-        if self._is_simulate():
-            return {"state": False, "value": None}
-        if _requests is None:
-            raise RuntimeError("requests 未安装")
         request_data = {
             "businessKey": "jbsqb",
             "id": None,
             "status": ["0", "-1"],
             "startTime": start_time,
             "endTime": end_time,
-            "userId": "1044",
+            "userId": self.tenant.user_id,
         }
-        response = _requests.post(
-            url=self.valid_exist_url,
-            json=request_data,
-            headers=self.headers,
-            timeout=self.config.REQUEST_TIMEOUT,
-        )
-        self._handle_response(response)
+        response = self._post(self.valid_exist_url, request_data, idempotent=True)
         return response.json()
 
     def get_daily_report(self, overtime_date: str) -> dict:
         """获取指定日期的日报内容（供 MCP 工具 daily.get 使用）"""
         if not self._validate_overtime_date(overtime_date):
             return {"error": "Invalid date format"}
-        if self._is_simulate():
-            return {
-                "content": f"{overtime_date} 仿真日报内容，修改其bug",
-                "project_name": self.config.PROJECT_NAME,
-                "project_id": self.config.PROJECT_ID,
-            }
-        if _requests is None and not self._is_simulate():
+        hit, row = self.daily_cache.lookup(overtime_date)
+        if hit:
+            return self._format_daily_row(row)
+        # 本地存储只保存确实存在的日报，没有时仍需查询上游（日报可能是之后才填写的）；
+        # 存储中的日报超过 DAILY_STORE_TTL 未刷新时同样回到上游，上游修改过的日报不会一直读到旧内容
+        row = self.daily_store.get(overtime_date, self.config.DAILY_STORE_TTL)
+        if row is not None:
+            self.daily_cache.put(overtime_date, row)
+            return self._format_daily_row(row)
+        if self.transport is None:
             return {"error": "requests 未安装"}
+        # daily.get 与 overtime.auto 同时查询同一日期时合并为一次上游拉取
+        key = ("daily.get", self.tenant.tenant_id, overtime_date)
+        try:
+            result, shared = self._coalesce(key, lambda: self._fetch_daily_report(overtime_date))
+        except TimeoutError as e:
+            return {"error": str(e)}
+        return dict(result) if shared else result
 
-        body = {
-            "templateId": self.config.DAILY_TEMPLATE_ID,
-            "queryFilter": {
-                "pageBean": {"page": 1, "pageSize": 80},
-                "querys": [],
-                "sorter": [],
-            },
-        }
+    def _coalesce(self, key, func):
+        """
+        加入或发起 key 对应的在途调用，最多等待到本次调用的剩余预算
+        在途调用被其发起方取消时，本调用若未被取消则重新发起
+        """
+        while True:
+            try:
+                return self.inflight.do(key, func, remaining_time())
+            except RequestCancelledError:
+                if is_cancelled():
+                    raise
+
+    def _fetch_daily_report(self, overtime_date: str) -> dict:
+        """缓存未命中时向上游分页查找指定日期的日报"""
+
+        # 服务端按 DATE_ <= 目标日期过滤并倒序返回，目标日期若存在必在第一页开头
+        querys = [self._build_date_query("LESS_EQUAL", overtime_date)]
+        target = None
         try:
-            response = _requests.post(
-                url=self.daily_list_url,
-                json=body,
-                headers=self.headers,
-                timeout=self.config.REQUEST_TIMEOUT,
-            )
-            self._handle_response(response)
-            data = response.json()
-        except TokenExpiredError:
+            for row in self.iter_daily_rows(querys):
+                row_date = row.get("DATE_") or ""
+                if row_date == overtime_date:
+                    target = row
+                    break
+                if row_date < overtime_date:
+                    break
+        except (TokenExpiredError, RequestCancelledError):
             raise
         except Exception as e:
             return {"error": str(e)}
 
-        rows = data.get("rows") or []
-        for row in rows:
-            if row.get("DATE_") == overtime_date:
-                content = row.get("content") or row.get("CONTENT_")
-                project_name = self.config.PROJECT_NAME
-                project_id = self.config.PROJECT_ID
-                return {
-                    "content": content,
-                    "project_name": project_name,
-                    "project_id": project_id,
-                }
-        return {"content": None, "message": "No daily report found for this date"}
+        # 未找到的日期同样缓存（负缓存），TTL 内不再重复拉取
+        self.daily_cache.put(overtime_date, target)
+        return self._format_daily_row(target)
+
+    def _build_date_query(self, operation: str, date: str) -> dict:
+        return {
+            "property": "DATE_",
+            "value": date,
+            "group": "main",
+            "operation": operation,
+            "relation": "AND",
+        }
+
+    def iter_daily_rows(self, querys: list = None, page_size: int = None, max_pages: int = None):
+        """
+        分页流式遍历日报列表（listJson），按 DATE_ 倒序逐页拉取、逐行产出
+        调用方在越过目标日期后停止迭代即可，不会再请求后续页
+        :param querys: 服务端过滤条件
+        :param page_size: 每页条数，默认取配置 DAILY_PAGE_SIZE
+        :param max_pages: 最多翻页数，默认取配置 DAILY_MAX_PAGES
+        """
+        page_size = page_size or self.config.DAILY_PAGE_SIZE
+        max_pages = max_pages or self.config.DAILY_MAX_PAGES
+        for page in range(1, max_pages + 1):
+            body = {
+                "templateId": self.config.DAILY_TEMPLATE_ID,
+                "queryFilter": {
+                    "pageBean": {"page": page, "pageSize": page_size},
+                    "querys": querys or [],
+                    "sorter": [{"property": "DATE_", "direction": "DESC"}],
+                },
+            }
+            data = self._post(self.daily_list_url, body, idempotent=True).json()
+            rows = data.get("rows") or []
+            # 每页拉到的日报顺带入缓存并持久化，相邻日期的后续查询与重启后的查询直接命中
+            self.daily_cache.put_rows(rows)
+            self.daily_store.put_rows(rows)
+            yield from rows
+            total = data.get("total")
+            if len(rows) < page_size or (total is not None and page * page_size >= int(total)):
+                return
+
+    def sync_daily_reports(self) -> int:
+        """
+        增量同步日报到本地存储：只拉取上次同步日期（含当天，当天的日报可能已被修改）之后的日报，
+        按 DATE_ 倒序越过该日期即停止；从未同步时回溯 DAILY_SYNC_DAYS 天
+        :return: 本次拉取的日报行数
+        """
+        if self.transport is None:
+            return 0
+        date_format = self.config.DATE_FORMAT
+        today = datetime.now()
+        since = self.daily_store.last_synced_date()
+        if since is None:
+            since = (today - timedelta(days=max(1, self.config.DAILY_SYNC_DAYS) - 1)).strftime(date_format)
+        today_str = today.strftime(date_format)
+        querys = [
+            self._build_date_query("GREAT_EQUAL", since),
+            self._build_date_query("LESS_EQUAL", today_str),
+        ]
+        span = (today - datetime.strptime(since, date_format)).days + 1
+        count = 0
+        for row in self.iter_daily_rows(querys, page_size=min(max(span, self.config.DAILY_PAGE_SIZE), 100)):
+            if (row.get("DATE_") or "") < since:
+                break
+            count += 1
+        self.daily_store.set_last_synced_date(today_str)
+        return count
+
+    def _format_daily_row(self, row) -> dict:
+        if row is None:
+            return {"content": None, "message": "No daily report found for this date"}
+        content = row.get("content") or row.get("CONTENT_")
+        project_name = self.tenant.project_name
+        project_id = self.tenant.project_id
+        return {
+            "content": content,
+            "project_name": project_name,
+            "project_id": project_id,
+        }
 
     def _build_auto_overtime_from_daily(self, overtime_date: str):
         # 复用 get_daily_report 逻辑，保持原有行为
@@ -165,79 +452,150 @@ class OvertimeSubmitTask:
             "project_id": info.get("project_id"),
         }
 
+    def _build_payload_template(self) -> dict:
+        """预先渲染租户的流程表单静态字段（身份、部门等），每次提报只填充日期、时间与内容"""
+        tenant = self.tenant
+        return {
+            "UPDATE_BY_ID_": tenant.user_id,
+            "APPROVER_TIME_": "",
+            "OVERTIME_DATE_": None,
+            "DEPT_ID_": tenant.dept_id,
+            "APPLICATION_TIME_": None,
+            "UPDATE_BY_": tenant.employee_name,
+            "OVERTIME_DURATION_": None,
+            "EMPLOYEE_NAME_": tenant.employee_name,
+            "APPROVER_STATUS_": "0",
+            "CREATE_TIME_": None,
+            "SUBMIT_DATE": None,
+            "OVERTIME_REASON_": None,
+            "PROJECT_NAME_": None,
+            "CREATE_ORG_": tenant.dept_name,
+            "UPDATE_TIME_": None,
+            "CREATE_ORG_ID_": tenant.dept_id,
+            "DEPT_NAME_": tenant.dept_name,
+            "START_TIME_": None,
+            "CREATE_BY_ID_": tenant.user_id,
+            "CREATE_BY_": tenant.employee_name,
+            "EMPLOYEE_ID_": "",
+            "END_TIME_": None,
+            "APPROVER_ID_": "",
+            "PROJECT_ID_": None,
+        }
+
     def _build_start_process_data(self, overtime_date: str, start_time: str, end_time: str, overtime_content: str, project_name: str = None, project_id: str = None) -> str:
         now = datetime.now()
         now_str = now.strftime("%Y-%m-%d %H:%M:%S")
         submit_year = int(overtime_date.split("-")[0])
-        start_dt = datetime.strptime(start_time, "%Y-%m-%d %H:%M:%S")
-        end_dt = datetime.strptime(end_time, "%Y-%m-%d %H:%M:%S")
-        overtime_duration = int((end_dt - start_dt).total_seconds() // 3600)
-        project_name_value = project_name or self.config.PROJECT_NAME
-        project_id_value = project_id or self.config.PROJECT_ID
-        payload = {
-            "jbsqb": {
-                "UPDATE_BY_ID_": "1044",
-                "APPROVER_TIME_": "",
-                "OVERTIME_DATE_": overtime_date,
-                "DEPT_ID_": "1875170026625798144",
-                "APPLICATION_TIME_": now_str,
-                "UPDATE_BY_": "马军",
-                "OVERTIME_DURATION_": overtime_duration,
-                "EMPLOYEE_NAME_": "马军",
-                "APPROVER_STATUS_": "0",
-                "CREATE_TIME_": now_str,
-                "SUBMIT_DATE": submit_year,
-                "OVERTIME_REASON_": overtime_content,
-                "PROJECT_NAME_": project_name_value,
-                "CREATE_ORG_": "研发部",
-                "UPDATE_TIME_": now_str,
-                "CREATE_ORG_ID_": "1875170026625798144",
-                "DEPT_NAME_": "研发部",
-                "START_TIME_": start_time,
-                "CREATE_BY_ID_": "1044",
-                "CREATE_BY_": "马军",
-                "EMPLOYEE_ID_": "",
-                "END_TIME_": end_time,
-                "APPROVER_ID_": "",
-                "PROJECT_ID_": project_id_value,
-                "initData": {},
-            }
-        }
-        json_str = json.dumps(payload, ensure_ascii=False)
-        return base64.b64encode(json_str.encode("utf-8")).decode("utf-8")
+        overtime_duration = overtime_hours(start_time, end_time)
+        record = dict(self._payload_template)
+        record.update({
+            "OVERTIME_DATE_": overtime_date,
+            "APPLICATION_TIME_": now_str,
+            "OVERTIME_DURATION_": overtime_duration,
+            "CREATE_TIME_": now_str,
+            "SUBMIT_DATE": submit_year,
+            "OVERTIME_REASON_": overtime_content,
+            "PROJECT_NAME_": project_name or self.tenant.project_name,
+            "UPDATE_TIME_": now_str,
+            "START_TIME_": start_time,
+            "END_TIME_": end_time,
+            "PROJECT_ID_": project_id or self.tenant.project_id,
+            "initData": {},
+        })
+        with stage("payload.json"):
+            json_str = json.dumps({"jbsqb": record}, ensure_ascii=False)
+        with stage("payload.base64"):
+            return base64.b64encode(json_str.encode("utf-8")).decode("utf-8")
 
     def _start_overtime_process(self, data_base64: str):
-        if self._is_simulate():
-            class Resp:
-                def __init__(self):
-                    self.status_code = 200
-                def json(self):
-                    return {"state": True, "message": "流程启动成功(仿真)", "instId": f"SIM-{int(datetime.now().timestamp())}"}
-            return Resp()
-        if _requests is None:
-            raise RuntimeError("requests 未安装")
         request_data = {
-            "defId": "1882365832407658496",
+            "defId": self.tenant.def_id,
             "data": data_base64,
             "formType": "inner",
             "supportMobile": 0,
         }
-        response = _requests.post(
-            url=self.start_flow_url,
-            json=request_data,
-            headers=self.headers,
-            timeout=self.config.REQUEST_TIMEOUT,
-        )
-        self._handle_response(response)
+        return self._post(self.start_flow_url, request_data)
+
+    def _check_ledger_entry(self, entry, force: bool = False):
+        """
+        按本地台账判断是否可以直接跳过，无需任何网络请求
+        :param force: 强制重新提报：已成功 / 已存在的记录不再跳过（审批驳回或撤回后重新提交），交由上游校验
+        """
+        if entry is None:
+            return None
+        if entry["status"] in (STATUS_SUCCESS, STATUS_EXISTS):
+            if force:
+                return None
+            message = "本地台账已记录该时段的加班提报，本次提报被跳过"
+        elif entry["status"] == STATUS_PENDING and self.ledger.is_own(entry):
+            message = "该时段的加班提报正在进行中，本次提报被跳过"
+        else:
+            return None
+        return {
+            "task_status": "skipped",
+            "task_type": "overtime_submit",
+            "message": message,
+            "data": entry,
+            "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        }
+
+    def _start_overtime_process_recorded(self, overtime_date: str, start_time: str, end_time: str, data_base64: str):
+        """发起流程并同步维护台账：先记 pending，按结果改为 success / 删除 / unknown"""
+        self.ledger.record(overtime_date, start_time, end_time, STATUS_PENDING)
+        try:
+            response = self._start_overtime_process(data_base64)
+        except Exception as e:
+            if isinstance(e, (CircuitOpenError, DeadlineExceededError, RequestCancelledError)):
+                # 请求未发出（熔断、预算耗尽或已取消），流程肯定未创建
+                self.ledger.remove(overtime_date, start_time, end_time)
+            elif isinstance(e, TokenExpiredError) or getattr(e, "response", None) is not None:
+                # 服务端已明确返回错误，流程肯定未创建
+                self.ledger.remove(overtime_date, start_time, end_time)
+            else:
+                # 超时或连接中断：请求可能已被处理，留待下次提报时向上游确认
+                self.ledger.record(overtime_date, start_time, end_time, STATUS_UNKNOWN)
+            raise
+        try:
+            data = response.json()
+        except ValueError:
+            data = {}
+        if isinstance(data, dict) and data.get("state") is False:
+            self.ledger.remove(overtime_date, start_time, end_time)
+        else:
+            inst_id = data.get("instId") if isinstance(data, dict) else None
+            self.ledger.record(overtime_date, start_time, end_time, STATUS_SUCCESS, inst_id)
         return response
 
-    def execute(self, overtime_date: str, overtime_content: str = None) -> dict:
+    def execute(self, overtime_date: str, overtime_content: str = None, force: bool = False) -> dict:
         """
         子任务执行入口（MCP 主控程序调用该方法触发加班提报）
+        同一日期已有提报在途时不再重复发起流程，直接等待并返回在途提报的结果（附带 coalesced 标记）
         :param overtime_date: 加班日期（YYYY-MM-DD）
         :param overtime_content: 加班内容，不传则使用默认值
+        :param force: 忽略本地台账中已成功的记录，经 validExist 确认上游没有未完成的记录后重新提报
         :return: 任务执行结果（供 MCP 记录日志）
+        :raises RequestCancelledError: 客户端已取消本次请求，尚未发起的上游调用全部放弃
+        :raises TokenExpiredError: 上游返回 401
         """
+        key = ("overtime.submit", self.tenant.tenant_id, overtime_date, bool(force))
+        try:
+            result, shared = self._coalesce(
+                key, lambda: self._record_summary(overtime_date, self._execute(overtime_date, overtime_content, force))
+            )
+        except TimeoutError as e:
+            return {
+                "task_status": "failed",
+                "task_type": "overtime_submit",
+                "message": f"同一日期的提报仍在进行中：{str(e)}",
+                "data": None,
+                "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+        if shared:
+            # 每个调用方拿到独立的副本，批量提报等调用方会在结果上追加字段
+            result = dict(result, coalesced=True)
+        return result
+
+    def _execute(self, overtime_date: str, overtime_content: str = None, force: bool = False) -> dict:
         if not self.base_url or not self.base_url.startswith(("http://", "https://")):
             return {
                 "task_status": "failed",
@@ -255,11 +613,32 @@ class OvertimeSubmitTask:
                 "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             }
 
+        day_type, day_name = self.calendar.classify(overtime_date)
+        if day_type not in WORKING_DAY_TYPES and is_truthy(self.config.SKIP_NON_WORKDAYS):
+            # 周末与节假日不提报加班，本地判断后直接跳过，不访问上游
+            return {
+                "task_status": "skipped",
+                "task_type": "overtime_submit",
+                "message": f"{overtime_date} 为{self.calendar.describe(overtime_date)}，不提报加班",
+                "data": {"day_type": day_type, "name": day_name},
+                "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            }
+
         start_time, end_time = self._build_datetime_range(overtime_date)
+        with stage("ledger.check"):
+            ledger_entry = self.ledger.get(overtime_date, start_time, end_time)
+            skipped = self._check_ledger_entry(ledger_entry, force)
+        if skipped:
+            return skipped
+        # 其他进程遗留的 pending 或 unknown：提报结果未知，需要向上游确认；
+        # 强制重新提报的已成功记录同样逐日向上游确认，不信任本地索引
+        in_doubt = ledger_entry is not None
+
         project_name = None
         project_id = None
         if overtime_content is None:
-            auto_data = self._build_auto_overtime_from_daily(overtime_date)
+            with stage("daily.lookup"):
+                auto_data = self._build_auto_overtime_from_daily(overtime_date)
             if auto_data:
                 overtime_content = auto_data["content"]
                 project_name = auto_data.get("project_name")
@@ -267,29 +646,17 @@ class OvertimeSubmitTask:
             else:
                 overtime_content = self.config.OVERTIME_CONTENT_DEFAULT
 
-        if self._is_simulate():
-            data_base64 = self._build_start_process_data(
-                overtime_date, start_time, end_time, overtime_content, project_name, project_id
-            )
-            inst_id = f"SIM-{int(datetime.now().timestamp())}"
-            return {
-                "task_status": "success",
-                "task_type": "overtime_submit",
-                "message": "仿真模式：加班流程启动模拟成功",
-                "data": {
-                    "state": True,
-                    "message": "流程启动成功(仿真)",
-                    "instId": inst_id,
-                    "inst": {"id": inst_id, "subject": f"仿真加班-{overtime_date}"},
-                    "data_base64": data_base64,
-                },
-                "status_code": 200,
-                "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-            }
-
         try:
-            valid_exist_result = self._request_valid_exist(start_time, end_time)
+            with stage("exist.check"):
+                if not in_doubt and self.exist_index.covers(overtime_date):
+                    # 已被区间预查覆盖的日期直接查本地索引，不再逐日请求 validExist
+                    exists = self.exist_index.overlaps(start_time, end_time)
+                    valid_exist_result = {"state": exists, "value": exists or None, "source": "local_index"}
+                else:
+                    valid_exist_result = self._request_valid_exist(start_time, end_time)
             if valid_exist_result.get("state") and valid_exist_result.get("value"):
+                if in_doubt:
+                    self.ledger.record(overtime_date, start_time, end_time, STATUS_EXISTS)
                 return {
                     "task_status": "skipped",
                     "task_type": "overtime_submit",
@@ -298,15 +665,20 @@ class OvertimeSubmitTask:
                     "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
                 }
 
-            data_base64 = self._build_start_process_data(
-                overtime_date,
-                start_time,
-                end_time,
-                overtime_content,
-                project_name,
-                project_id,
-            )
-            response = self._start_overtime_process(data_base64)
+            with stage("payload.build"):
+                data_base64 = self._build_start_process_data(
+                    overtime_date,
+                    start_time,
+                    end_time,
+                    overtime_content,
+                    project_name,
+                    project_id,
+                )
+            # 发起流程前最后一次检查取消：客户端已放弃的请求不再创建流程实例
+            check_cancelled()
+            with stage("process.start"):
+                response = self._start_overtime_process_recorded(overtime_date, start_time, end_time, data_base64)
+            self.exist_index.add(start_time, end_time)
 
             return {
                 "task_status": "success",
@@ -316,6 +688,9 @@ class OvertimeSubmitTask:
                 "status_code": response.status_code,
                 "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             }
+        except (TokenExpiredError, RequestCancelledError):
+            # 令牌过期交给 MCP 主控热更新令牌后重试，不作为提报失败计入汇总
+            raise
         except Exception as e:
             return {
                 "task_status": "failed",
@@ -324,3 +699,222 @@ class OvertimeSubmitTask:
                 "data": None,
                 "datetime": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
             }
+
+    def _record_summary(self, overtime_date: str, result: dict) -> dict:
+        """把一次 execute 的结果计入本地加班汇总（日期格式错误等未进入提报流程的结果不计入）"""
+        if not self._validate_overtime_date(overtime_date) or result.get("task_type") != "overtime_submit":
+            return result
+        data = result.get("data") if isinstance(result.get("data"), dict) else {}
+        status, hours, inst_id = result.get("task_status"), 0, None
+        if status == "success":
+            start_time, end_time = self._build_datetime_range(overtime_date)
+            hours, inst_id = overtime_hours(start_time, end_time), data.get("instId")
+        elif status == "skipped" and data.get("status") in (STATUS_SUCCESS, STATUS_EXISTS):
+            # 本地台账拦截的重复提报：沿用台账中的状态
+            status, inst_id = data["status"], data.get("inst_id")
+            if status == STATUS_SUCCESS:
+                hours = overtime_hours(data["start_time"], data["end_time"])
+        elif status == "skipped" and data.get("value"):
+            # 上游 validExist 确认已存在记录
+            status = STATUS_EXISTS
+        elif status == "skipped":
+            # 周末、节假日或同一时段正在提报中
+            if data.get("status") == STATUS_PENDING:
+                return result
+            status = SUMMARY_SKIPPED
+        else:
+            status = SUMMARY_FAILED
+        try:
+            self.ledger.record_day(overtime_date, status, hours, inst_id)
+        except Exception:
+            # 汇总写入失败不影响提报结果本身
+            pass
+        return result
+
+    def summary(self, month: str = None, start_date: str = None, end_date: str = None) -> dict:
+        """
+        本地加班汇总（overtime.summary）：逐日状态与时长，以及涉及的各周、各月合计，不访问上游
+        :param month: 月份（YYYY-MM），与 start_date/end_date 二选一；都不传时为本月
+        :raises ValueError: 日期或月份格式错误
+        """
+        if start_date or end_date:
+            start_date, end_date = start_date or end_date, end_date or start_date
+            for value in (start_date, end_date):
+                if not self._validate_overtime_date(value):
+                    raise ValueError(f"日期格式错误，需符合 {self.config.DATE_FORMAT} 规范：{value}")
+            start_date = datetime.strptime(start_date, self.config.DATE_FORMAT).strftime(self.config.DATE_FORMAT)
+            end_date = datetime.strptime(end_date, self.config.DATE_FORMAT).strftime(self.config.DATE_FORMAT)
+            if start_date > end_date:
+                raise ValueError("start_date 不能晚于 end_date")
+        else:
+            try:
+                first = datetime.strptime(month, "%Y-%m") if month else datetime.now().replace(day=1)
+            except ValueError:
+                raise ValueError(f"月份格式错误，需为 YYYY-MM：{month}")
+            next_month = (first.replace(day=28) + timedelta(days=4)).replace(day=1)
+            start_date = first.strftime(self.config.DATE_FORMAT)
+            end_date = (next_month - timedelta(days=1)).strftime(self.config.DATE_FORMAT)
+        result = self.ledger.summary(start_date, end_date)
+        result["tenant"] = self.tenant.tenant_id
+        return result
+
+    def expand_dates(self, dates: list = None, start_date: str = None, end_date: str = None) -> list:
+        """
+        展开批量提报的日期：支持日期列表或起止区间（含两端），去重后按日期升序返回
+        :raises ValueError: dates 不是字符串列表、日期格式错误或超出单次批量上限
+        """
+        if dates is not None and (
+            not isinstance(dates, (list, tuple)) or not all(isinstance(d, str) for d in dates)
+        ):
+            raise ValueError("dates 需为日期字符串列表，如 [\"2026-01-05\"]")
+        collected = list(dates or [])
+        if start_date or end_date:
+            if not (start_date and end_date):
+                raise ValueError("日期区间需要同时提供 start_date 和 end_date")
+            if not (self._validate_overtime_date(start_date) and self._validate_overtime_date(end_date)):
+                raise ValueError(f"日期格式错误，需符合 {self.config.DATE_FORMAT} 规范")
+            current = datetime.strptime(start_date, self.config.DATE_FORMAT)
+            last = datetime.strptime(end_date, self.config.DATE_FORMAT)
+            if (last - current).days >= self.config.BATCH_MAX_DATES:
+                raise ValueError(f"单次批量最多 {self.config.BATCH_MAX_DATES} 天")
+            while current <= last:
+                collected.append(current.strftime(self.config.DATE_FORMAT))
+                current += timedelta(days=1)
+        unique = sorted(set(collected))
+        if not unique:
+            raise ValueError("未提供任何加班日期")
+        if len(unique) > self.config.BATCH_MAX_DATES:
+            raise ValueError(f"单次批量最多 {self.config.BATCH_MAX_DATES} 天")
+        return unique
+
+    def _unresolved_dates(self, dates: list) -> list:
+        """去掉本地台账中已记录为 success / exists 的日期（execute 会直接本地跳过）"""
+        unresolved = []
+        for overtime_date in dates:
+            if self._validate_overtime_date(overtime_date):
+                entry = self.ledger.get(overtime_date, *self._build_datetime_range(overtime_date))
+                if entry is not None and entry["status"] in (STATUS_SUCCESS, STATUS_EXISTS):
+                    continue
+            unresolved.append(overtime_date)
+        return unresolved
+
+    def _prefetch_daily_range(self, dates: list):
+        """批量提报前用一次区间查询预热日报缓存，避免每个日期各自拉取"""
+        valid = [d for d in dates if self._validate_overtime_date(d)]
+        if self.transport is None or not valid:
+            return
+        querys = [
+            self._build_date_query("GREAT_EQUAL", valid[0]),
+            self._build_date_query("LESS_EQUAL", valid[-1]),
+        ]
+        found = set()
+        try:
+            for row in self.iter_daily_rows(querys, page_size=max(len(valid), self.config.DAILY_PAGE_SIZE)):
+                row_date = row.get("DATE_") or ""
+                found.add(row_date)
+                if row_date < valid[0]:
+                    break
+        except (TokenExpiredError, RequestCancelledError):
+            raise
+        except Exception:
+            # 预热失败不影响提报，各日期回退到单独查询
+            return
+        for date in valid:
+            if date not in found:
+                self.daily_cache.put(date, None)
+
+    def prefetch_existing(self, dates: list):
+        """
+        区间预查已存在的加班记录：整段日期只发一次 validExist，结果写入本地区间索引
+        服务端只返回是否存在时，对命中的区间二分拆分定位到具体日期，
+        已存在记录较少时请求数为 O(k·log n)（k 为已存在记录的天数），较多时不超过逐日查询的 n 次左右
+        定位过程中的结果先记在临时列表里，整次预查成功后才写入索引：中途失败时不会留下
+        「已覆盖但区间缺失」的日期，否则 execute 会信任覆盖标记而重复提报
+        """
+        valid = sorted(d for d in dates if self._validate_overtime_date(d))
+        if self.transport is None or not valid:
+            return
+        span_start, _ = self._build_datetime_range(valid[0])
+        _, span_end = self._build_datetime_range(valid[-1])
+        found = []
+        try:
+            self._locate_existing(valid, found)
+        except Exception as e:
+            # 预查失败时整段回退到逐日查询：清掉该区间的旧结果与覆盖标记
+            self.exist_index.discard(span_start, span_end)
+            self.exist_index.uncover(valid)
+            if isinstance(e, (TokenExpiredError, RequestCancelledError)):
+                raise
+            return
+        self.exist_index.discard(span_start, span_end)
+        for record_start, record_end in found:
+            self.exist_index.add(record_start, record_end)
+        self.exist_index.mark_covered(valid)
+
+    def _locate_existing(self, dates: list, found: list):
+        """
+        逐层二分：每层把命中的区间拆成两半分别查询
+        某层拆分后大多数子区间仍然命中，说明已存在记录的日期接近全部日期，
+        继续二分的请求数会超过逐日查询，剩余区间改为逐日查询
+        :param found: 收集定位到的已存在记录 (开始时间, 结束时间)
+        """
+        pending = [dates] if self._query_existing(dates, found) else []
+        while pending:
+            halves = [part for group in pending for part in (group[:len(group) // 2], group[len(group) // 2:])]
+            pending = [part for part in halves if self._query_existing(part, found)]
+            if len(pending) * 4 >= len(halves) * 3:
+                for group in pending:
+                    for overtime_date in group:
+                        self._query_existing([overtime_date], found)
+                return
+
+    def _query_existing(self, dates: list, found: list) -> bool:
+        """
+        对一段连续规划的日期发一次 validExist，能确定的已存在记录追加到 found
+        :return: 区间命中但尚未定位到具体日期（需要继续拆分）
+        """
+        start_time, _ = self._build_datetime_range(dates[0])
+        _, end_time = self._build_datetime_range(dates[-1])
+        result = self._request_valid_exist(start_time, end_time)
+        value = result.get("value") if result.get("state") else None
+        if isinstance(value, list):
+            # 服务端返回记录明细时直接按记录起止时间记录
+            for record in value:
+                record_start = record.get("START_TIME_") or record.get("startTime")
+                record_end = record.get("END_TIME_") or record.get("endTime")
+                if record_start and record_end:
+                    found.append((record_start, record_end))
+        elif value:
+            if len(dates) > 1:
+                return True
+            found.append((start_time, end_time))
+        return False
+
+    def execute_batch(self, dates: list, overtime_content: str = None, max_workers: int = None, force: bool = False) -> list:
+        """
+        批量提报入口：按日期并发执行 execute，线程数受 BATCH_MAX_WORKERS 限制
+        :param dates: 加班日期列表（通常先经 expand_dates 展开）
+        :param overtime_content: 统一的加班内容，不传则每天各自读取日报
+        :param force: 同 execute，本地台账已成功的日期也重新向上游确认并提报
+        :return: 与 dates 顺序一致的结果列表，每项为 execute 的结果并附带 overtime_date
+        """
+        # 周末与节假日在 execute 中本地跳过，本地台账已确认提报过的日期同样无需预查，
+        # 区间预查只覆盖仍需向上游确认的日期（强制重新提报时这些日期在 execute 中逐日确认）
+        working = self.working_dates(dates)
+        planned = self._unresolved_dates(working)
+        if overtime_content is None:
+            with stage("batch.prefetch_daily"):
+                self._prefetch_daily_range(working if force else planned)
+        with stage("batch.prefetch_existing"):
+            self.prefetch_existing(planned)
+        workers = max(1, min(max_workers or self.config.BATCH_MAX_WORKERS, len(dates)))
+
+        def run_one(overtime_date):
+            result = self.execute(overtime_date, overtime_content, force)
+            result["overtime_date"] = overtime_date
+            return result
+
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="overtime-batch") as executor:
+            # 每个日期在调用方上下文的副本中执行，共享同一个截止时间预算
+            futures = [executor.submit(contextvars.copy_context().run, run_one, d) for d in dates]
+            return [future.result() for future in futures]
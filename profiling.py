@@ -0,0 +1,158 @@
+# profiling.py - 按需性能剖析：单次工具调用的阶段耗时、cProfile 调用统计与 tracemalloc 内存峰值
+import io
+import os
+import json
+import time
+import pstats
+import cProfile
+import threading
+import tracemalloc
+import contextvars
+from datetime import datetime
+from contextlib import contextmanager
+
+# 当前工具调用的剖析记录，None 表示未开启（stage 只做一次 ContextVar 读取）
+_CURRENT_PROFILE = contextvars.ContextVar("overtime_profile", default=None)
+
+# tracemalloc 为进程级开关：有剖析在进行时保持开启，最后一个结束时关闭
+_TRACEMALLOC_LOCK = threading.Lock()
+_TRACEMALLOC_USERS = 0
+
+
+class CallProfile:
+    """一次工具调用的剖析记录：阶段耗时按名称聚合（批量提报的多个线程共用同一记录）"""
+    def __init__(self, label: str):
+        self.label = label
+        self.started_at = datetime.now()
+        self.stages = {}
+        self._lock = threading.Lock()
+
+    def add_stage(self, name: str, elapsed: float):
+        elapsed_ms = elapsed * 1000
+        with self._lock:
+            entry = self.stages.setdefault(name, {"count": 0, "total_ms": 0.0, "max_ms": 0.0})
+            entry["count"] += 1
+            entry["total_ms"] += elapsed_ms
+            entry["max_ms"] = max(entry["max_ms"], elapsed_ms)
+
+    def stage_snapshot(self) -> dict:
+        with self._lock:
+            return {
+                name: {
+                    "count": entry["count"],
+                    "total_ms": round(entry["total_ms"], 3),
+                    "max_ms": round(entry["max_ms"], 3),
+                }
+                for name, entry in self.stages.items()
+            }
+
+
+@contextmanager
+def stage(name: str):
+    """记录一个阶段的墙钟耗时；当前调用未开启剖析时不做任何事"""
+    profile = _CURRENT_PROFILE.get()
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_stage(name, time.perf_counter() - started)
+
+
+def _start_tracemalloc():
+    global _TRACEMALLOC_USERS
+    with _TRACEMALLOC_LOCK:
+        if _TRACEMALLOC_USERS == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        _TRACEMALLOC_USERS += 1
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _stop_tracemalloc():
+    global _TRACEMALLOC_USERS
+    with _TRACEMALLOC_LOCK:
+        current, peak = tracemalloc.get_traced_memory()
+        _TRACEMALLOC_USERS -= 1
+        if _TRACEMALLOC_USERS == 0:
+            tracemalloc.stop()
+        return current, peak
+
+
+def _safe_name(value: str) -> str:
+    return "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in str(value))[:64]
+
+
+class ProfileSession:
+    """
+    一次工具调用的完整剖析：进入时开启 cProfile 与 tracemalloc 并绑定阶段记录，
+    退出后把报告（JSON 摘要 + 可用 snakeviz 等工具打开的 .prof）写入 report_dir
+    """
+    def __init__(self, label: str, report_dir: str, top: int = 30):
+        self.label = label
+        self.report_dir = report_dir
+        self.top = max(1, int(top))
+        self.profile = CallProfile(label)
+        self.report_path = None
+        self._profiler = None
+        self._cprofile_error = None
+
+    def __enter__(self):
+        self._token = _CURRENT_PROFILE.set(self.profile)
+        self._memory_start = _start_tracemalloc()
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+            self._profiler = profiler
+        except ValueError as e:
+            # 同一线程已有其他剖析器在运行，只记录阶段耗时与内存
+            self._cprofile_error = str(e)
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self._started
+        if self._profiler is not None:
+            self._profiler.disable()
+        memory_end, memory_peak = _stop_tracemalloc()
+        _CURRENT_PROFILE.reset(self._token)
+        try:
+            self.report_path = self._write_report(elapsed, memory_end, memory_peak, exc)
+        except OSError:
+            # 报告写入失败不影响工具调用本身
+            self.report_path = None
+        return False
+
+    def _write_report(self, elapsed: float, memory_end: int, memory_peak: int, exc) -> str:
+        if not os.path.exists(self.report_dir):
+            os.makedirs(self.report_dir, exist_ok=True)
+        base = os.path.join(
+            self.report_dir, f"{self.profile.started_at.strftime('%Y%m%d-%H%M%S-%f')}_{_safe_name(self.label)}"
+        )
+        report = {
+            "label": self.label,
+            "started_at": self.profile.started_at.strftime("%Y-%m-%d %H:%M:%S.%f"),
+            "wall_ms": round(elapsed * 1000, 3),
+            "error": repr(exc) if exc is not None else None,
+            "stages": self.profile.stage_snapshot(),
+            # tracemalloc 为进程级统计：同时有其他调用在执行时峰值包含它们的分配
+            "memory": {
+                "start_bytes": self._memory_start,
+                "end_bytes": memory_end,
+                "peak_bytes": memory_peak,
+            },
+            "cprofile": None,
+        }
+        if self._profiler is not None:
+            self._profiler.dump_stats(f"{base}.prof")
+            stream = io.StringIO()
+            stats = pstats.Stats(self._profiler, stream=stream)
+            stats.sort_stats("cumulative").print_stats(self.top)
+            report["cprofile"] = {"stats_file": f"{base}.prof", "top_cumulative": stream.getvalue()}
+        else:
+            report["cprofile"] = {"error": self._cprofile_error}
+        with open(f"{base}.json", "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        return f"{base}.json"
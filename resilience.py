@@ -0,0 +1,357 @@
+# resilience.py - 上游调用韧性：抖动指数退避重试、熔断器、自适应限流、按工具调用共享的截止时间预算与取消信号
+import time
+import random
+import threading
+import contextvars
+from contextlib import contextmanager
+
+
+class CircuitOpenError(Exception):
+    """熔断器打开：上游近期连续失败，直接快速失败而不再等待超时"""
+    pass
+
+
+class DeadlineExceededError(Exception):
+    """本次工具调用的总耗时预算已用完"""
+    pass
+
+
+class RequestCancelledError(Exception):
+    """客户端已取消本次请求（notifications/cancelled），后续上游调用不再发起"""
+    pass
+
+
+# 当前工具调用的截止时间（time.monotonic() 绝对值），None 表示不限
+_CURRENT_DEADLINE = contextvars.ContextVar("overtime_deadline", default=None)
+# 当前工具调用的取消信号（threading.Event），None 表示不可取消
+_CURRENT_CANCEL = contextvars.ContextVar("overtime_cancel", default=None)
+
+
+@contextmanager
+def deadline_scope(seconds: float = None):
+    """
+    在当前上下文内设置总耗时预算，范围内的所有上游请求共享同一个截止时间
+    已存在更早的截止时间时保留更早的那个
+    """
+    if not seconds or seconds <= 0:
+        yield
+        return
+    deadline = time.monotonic() + seconds
+    current = _CURRENT_DEADLINE.get()
+    if current is not None:
+        deadline = min(deadline, current)
+    token = _CURRENT_DEADLINE.set(deadline)
+    try:
+        yield
+    finally:
+        _CURRENT_DEADLINE.reset(token)
+
+
+@contextmanager
+def cancel_scope(cancel_event: threading.Event = None):
+    """在当前上下文内绑定取消信号，范围内的子任务在各阶段之间检查该信号"""
+    token = _CURRENT_CANCEL.set(cancel_event)
+    try:
+        yield
+    finally:
+        _CURRENT_CANCEL.reset(token)
+
+
+def is_cancelled() -> bool:
+    cancel_event = _CURRENT_CANCEL.get()
+    return cancel_event is not None and cancel_event.is_set()
+
+
+def check_cancelled():
+    """请求已被客户端取消时抛出 RequestCancelledError，在发起下一次上游调用前调用"""
+    if is_cancelled():
+        raise RequestCancelledError("请求已被客户端取消")
+
+
+def remaining_time():
+    """当前预算剩余秒数，未设置预算时返回 None"""
+    deadline = _CURRENT_DEADLINE.get()
+    if deadline is None:
+        return None
+    return deadline - time.monotonic()
+
+
+def budget_exhausted() -> bool:
+    """当前调用设置了预算且已经用完"""
+    remaining = remaining_time()
+    return remaining is not None and remaining <= 0
+
+
+def clamp_timeout(timeout):
+    """把 (连接超时, 读取超时) 压缩到剩余预算以内；预算已耗尽时抛出 DeadlineExceededError"""
+    remaining = remaining_time()
+    if remaining is None:
+        return timeout
+    if remaining <= 0:
+        raise DeadlineExceededError("本次调用已超出总耗时预算")
+    connect_timeout, read_timeout = timeout
+    return (min(connect_timeout, remaining), min(read_timeout, remaining))
+
+
+class CircuitBreaker:
+    """
+    熔断器：连续失败达到阈值后打开，打开期间直接抛 CircuitOpenError；
+    冷却 reset_timeout 秒后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开；
+    探测请求超过 probe_timeout 秒仍未回报结果时视为丢失，放行新的探测，熔断器不会卡在半开状态
+    """
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int, reset_timeout: float, probe_timeout: float = None):
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.reset_timeout = float(reset_timeout)
+        self.probe_timeout = float(probe_timeout) if probe_timeout else self.reset_timeout
+        self.state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started_at = 0.0
+        self._lock = threading.Lock()
+
+    def before_call(self) -> bool:
+        """
+        放行检查，每次放行后必须以 record_success / record_failure / release 之一回报
+        :return: 本次放行是否为半开状态的探测请求（传给 release）
+        :raises CircuitOpenError: 熔断中
+        """
+        with self._lock:
+            if self.state == self.CLOSED:
+                return False
+            now = time.monotonic()
+            if self.state == self.OPEN and now - self._opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and self._probe_in_flight:
+                # 探测请求的结果迟迟未回报（调用方异常退出等），视为丢失
+                if now - self._probe_started_at >= self.probe_timeout:
+                    self._probe_in_flight = False
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                self._probe_started_at = now
+                return True
+            raise CircuitOpenError("上游服务暂不可用（熔断中），请稍后重试")
+
+    def release(self, probe: bool):
+        """放行的请求未到达上游就结束（预算耗尽、已取消等）：不计成功或失败，只归还探测名额"""
+        if not probe:
+            return
+        with self._lock:
+            if self.state == self.HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self._opened_at = time.monotonic()
+            self._probe_in_flight = False
+
+
+# 自适应限流的调用结果：overload 为上游过载信号（429、5xx、超时与连接失败），ignore 不参与调整
+LIMIT_SUCCESS = "success"
+LIMIT_OVERLOAD = "overload"
+LIMIT_IGNORE = "ignore"
+# 等待名额时的轮询间隔（秒）：期间检查取消信号与剩余预算
+_LIMITER_POLL_INTERVAL = 0.05
+
+
+class AdaptiveLimiter:
+    """
+    按上游接口的自适应限流：令牌桶平滑突发，并发上限按 AIMD 自动调整，无需手工配置上游能力
+    - 成功且延迟未超过基线的 latency_tolerance 倍：并发上限加性增长（每满一个上限的成功数 +1），
+      只在实际并发接近上限时增长，空闲时上限不会虚涨
+    - 429 / 5xx / 超时 / 连接失败：并发上限减半；同一个平滑延迟窗口内的多个失败只减一次
+    - 延迟超过基线的 latency_tolerance 倍：视为上游开始排队，上限乘 0.9
+    令牌桶速率按 Little 定律取 2 × 并发上限 / 平滑延迟，批量提报的突发请求按上游可承受的速率发出
+    """
+    def __init__(self, initial_limit: float, max_limit: float, latency_tolerance: float = 2.0, min_limit: float = 1):
+        self.min_limit = max(1.0, float(min_limit))
+        self.max_limit = max(self.min_limit, float(max_limit))
+        self.limit = min(self.max_limit, max(self.min_limit, float(initial_limit)))
+        self.latency_tolerance = max(1.0, float(latency_tolerance))
+        self.in_flight = 0
+        self.latency = None
+        self.baseline = None
+        self._tokens = self.limit
+        self._refilled_at = time.monotonic()
+        self._decreased_at = 0.0
+        self._cond = threading.Condition()
+
+    @property
+    def rate(self):
+        """令牌桶速率（次/秒），尚无延迟样本时不限速"""
+        if not self.latency:
+            return None
+        return 2 * self.limit / self.latency
+
+    def _refill(self, now: float):
+        rate = self.rate
+        if rate is None:
+            self._tokens = self.limit
+        else:
+            self._tokens = min(self.limit, self._tokens + (now - self._refilled_at) * rate)
+        self._refilled_at = now
+
+    def acquire(self) -> float:
+        """
+        等待并占用一个并发名额与一个令牌，等待期间响应取消信号与本次调用的剩余预算
+        :return: 占用时刻（传输层未给出发出时刻时传给 release 计算延迟）
+        :raises DeadlineExceededError: 剩余预算内拿不到名额
+        """
+        with self._cond:
+            while True:
+                check_cancelled()
+                now = time.monotonic()
+                self._refill(now)
+                if self.in_flight < int(self.limit) and self._tokens >= 1:
+                    self._tokens -= 1
+                    self.in_flight += 1
+                    return now
+                remaining = remaining_time()
+                if remaining is not None and remaining <= 0:
+                    raise DeadlineExceededError("等待上游限流名额超时")
+                wait = _LIMITER_POLL_INTERVAL
+                if self.in_flight < int(self.limit) and self.rate:
+                    wait = min(wait, (1 - self._tokens) / self.rate)
+                if remaining is not None:
+                    wait = min(wait, remaining)
+                self._cond.wait(max(wait, 0.001))
+
+    def release(self, started_at: float, outcome: str):
+        """
+        归还名额并按本次调用的结果与延迟调整并发上限
+        :param started_at: 延迟的起算时刻（time.monotonic），通常为拿到连接后发出请求的时刻
+        """
+        now = time.monotonic()
+        with self._cond:
+            self.in_flight -= 1
+            if outcome == LIMIT_OVERLOAD:
+                self._decrease(now, 0.5)
+            elif outcome == LIMIT_SUCCESS:
+                self._observe_success(now - started_at, now)
+            self._cond.notify_all()
+
+    def _observe_success(self, elapsed: float, now: float):
+        self.latency = elapsed if self.latency is None else 0.8 * self.latency + 0.2 * elapsed
+        # 基线取观测到的最小延迟并缓慢上浮，上游整体变慢后基线随之跟上
+        self.baseline = elapsed if self.baseline is None else min(elapsed, self.baseline * 1.001)
+        if elapsed > self.baseline * self.latency_tolerance:
+            self._decrease(now, 0.9)
+        elif self.in_flight + 1 >= int(self.limit):
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+
+    def _decrease(self, now: float, factor: float):
+        window = self.latency or 0.1
+        if now - self._decreased_at < window:
+            return
+        self._decreased_at = now
+        self.limit = max(self.min_limit, self.limit * factor)
+        self._tokens = min(self._tokens, self.limit)
+
+    def snapshot(self) -> dict:
+        with self._cond:
+            return {
+                "limit": round(self.limit, 2),
+                "in_flight": self.in_flight,
+                "latency_ms": round(self.latency * 1000, 2) if self.latency else None,
+                "baseline_ms": round(self.baseline * 1000, 2) if self.baseline else None,
+                "rate_per_sec": round(self.rate, 2) if self.rate else None,
+            }
+
+
+_LIMITERS = {}
+_LIMITERS_LOCK = threading.Lock()
+
+
+def get_rate_limiter(key: str, config) -> AdaptiveLimiter:
+    """按（上游地址, 接口）共享限流器：同一主机的所有租户共用一个并发上限"""
+    with _LIMITERS_LOCK:
+        limiter = _LIMITERS.get(key)
+        if limiter is None:
+            limiter = _LIMITERS[key] = AdaptiveLimiter(
+                config.RATE_LIMIT_INITIAL, config.RATE_LIMIT_MAX, config.RATE_LIMIT_LATENCY_TOLERANCE
+            )
+        return limiter
+
+
+def rate_limiter_snapshot() -> dict:
+    with _LIMITERS_LOCK:
+        limiters = dict(_LIMITERS)
+    return {key: limiter.snapshot() for key, limiter in sorted(limiters.items())}
+
+
+def limit_outcome(error: Exception = None, response=None) -> str:
+    """把一次上游调用的结果归类为限流器的输入：429、5xx、超时与连接失败为过载信号"""
+    if error is not None:
+        response = getattr(error, "response", None)
+        if response is None:
+            if isinstance(error, (CircuitOpenError, DeadlineExceededError, RequestCancelledError)):
+                return LIMIT_IGNORE
+            return LIMIT_OVERLOAD if isinstance(error, OSError) else LIMIT_IGNORE
+    status_code = getattr(response, "status_code", 0)
+    if status_code == 429 or status_code >= 500:
+        return LIMIT_OVERLOAD
+    return LIMIT_SUCCESS if status_code < 400 else LIMIT_IGNORE
+
+
+_BREAKERS = {}
+_BREAKERS_LOCK = threading.Lock()
+
+
+def get_circuit_breaker(key: str, config) -> CircuitBreaker:
+    """按上游地址共享熔断器：同一主机的所有租户共用一个熔断状态"""
+    with _BREAKERS_LOCK:
+        breaker = _BREAKERS.get(key)
+        if breaker is None:
+            # 单次请求最长耗时（连接超时 + 读取超时）之后仍未回报的探测请求肯定已经丢失
+            breaker = _BREAKERS[key] = CircuitBreaker(
+                config.BREAKER_FAILURE_THRESHOLD,
+                config.BREAKER_RESET_TIMEOUT,
+                float(config.CONNECT_TIMEOUT) + float(config.READ_TIMEOUT),
+            )
+        return breaker
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """只重试网络异常、超时、429 与 5xx；熔断、预算耗尽、已取消、401 与其他 4xx 不重试"""
+    if isinstance(error, (CircuitOpenError, DeadlineExceededError, RequestCancelledError)):
+        return False
+    response = getattr(error, "response", None)
+    if response is not None:
+        status_code = getattr(response, "status_code", 0)
+        return status_code == 429 or status_code >= 500
+    # requests 的连接异常与超时均继承自 OSError（IOError）
+    return isinstance(error, OSError)
+
+
+def retry_call(func, attempts: int, base_delay: float, max_delay: float, is_retryable=is_retryable_error):
+    """
+    抖动指数退避重试（full jitter）：第 n 次重试前等待 [0, min(max_delay, base_delay * 2^n)] 内的随机时间
+    剩余预算不足以等待时直接抛出最后一次的异常
+    """
+    attempt = 0
+    while True:
+        try:
+            return func()
+        except Exception as e:
+            attempt += 1
+            if attempt >= attempts or not is_retryable(e):
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** attempt)))
+            remaining = remaining_time()
+            if remaining is not None and remaining <= delay:
+                raise
+            time.sleep(delay)
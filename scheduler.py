@@ -0,0 +1,174 @@
+# scheduler.py - 常驻调度：工作日加班结束后自动提报，停机期间漏掉的日期在下一次规划时合并为一次批量提报
+import os
+import json
+import threading
+from datetime import datetime, timedelta
+from upstream import is_truthy
+from work_calendar import get_work_calendar
+
+# 两次检查之间最长的等待时间（秒）：系统休眠或调整时钟后最迟一分钟内重新计算下次提报时间
+_MAX_WAIT_SECONDS = 60
+
+
+class OvertimeScheduler:
+    """
+    常驻调度器：在 OvertimeMCP 进程内运行，复用已预热的会话、日报缓存与台账
+    每次规划从上次已完成的日期（水位线，按租户持久化）之后开始，到最近一个已过提报时间的日期为止，
+    其中的工作日合并为一次批量提报；已提报的日期由台账直接跳过，不会重复发起流程
+    """
+    def __init__(self, overtime_mcp, now=datetime.now):
+        self.mcp = overtime_mcp
+        self.config = overtime_mcp.config
+        self.logger = overtime_mcp.logger
+        self.now = now
+        self._stop = threading.Event()
+        self._thread = None
+
+    def is_workday(self, day) -> bool:
+        """与提报时的本地跳过使用同一工作日历：法定节假日不提报，调休上班日照常提报"""
+        return get_work_calendar(self.config).is_workday(day)
+
+    def trigger_time(self, day) -> datetime:
+        """某一天的提报时间：FIXED_OVERTIME_END 之后 SCHEDULE_OFFSET_MINUTES 分钟"""
+        end = datetime.strptime(self.config.FIXED_OVERTIME_END, "%H:%M:%S").time()
+        return datetime.combine(day, end) + timedelta(minutes=self.config.SCHEDULE_OFFSET_MINUTES)
+
+    def tenant_ids(self) -> list:
+        value = (self.config.SCHEDULE_TENANTS or "").strip()
+        if value == "*":
+            return sorted(self.mcp.tenants)
+        return [t.strip() for t in value.split(",") if t.strip()]
+
+    def _load_state(self) -> dict:
+        path = self.config.SCHEDULE_STATE_FILE
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            self.logger.warning("调度水位线文件读取失败，按首次运行处理：%s", e)
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _save_state(self, state: dict):
+        path = self.config.SCHEDULE_STATE_FILE
+        directory = os.path.dirname(path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory)
+        # 先写临时文件再替换，进程中途退出也不会留下半个文件
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def plan(self, watermark: str = None, now: datetime = None) -> tuple:
+        """
+        规划本次需要提报的日期
+        :param watermark: 上次已完成的日期；为空表示首次运行，只处理今天
+        :return: (待提报的工作日列表, 本次规划覆盖到的最后一天)
+        """
+        now = now or self.now()
+        date_format = self.config.DATE_FORMAT
+        latest = now.date() if now >= self.trigger_time(now.date()) else now.date() - timedelta(days=1)
+        catchup_days = max(1, min(self.config.SCHEDULE_CATCHUP_DAYS, self.config.BATCH_MAX_DATES))
+        earliest = latest - timedelta(days=catchup_days - 1)
+        if watermark:
+            earliest = max(earliest, datetime.strptime(watermark, date_format).date() + timedelta(days=1))
+        else:
+            earliest = max(earliest, now.date())
+        dates = []
+        day = earliest
+        while day <= latest:
+            if self.is_workday(day):
+                dates.append(day.strftime(date_format))
+            day += timedelta(days=1)
+        return dates, latest.strftime(date_format)
+
+    def run_pass(self, now: datetime = None) -> dict:
+        """
+        执行一次规划：每个租户的待提报日期合并为一次批量提报，按结果推进水位线
+        遇到失败的日期时水位线停在它之前，下次规划会重新覆盖（已成功的日期由台账跳过）
+        :return: 租户 -> 批量提报结果（无待提报日期的租户不出现）
+        """
+        self.mcp.refresh_config_if_changed()
+        state = self._load_state()
+        results = {}
+        for tenant_id in self.tenant_ids():
+            dates, latest = self.plan(state.get(tenant_id), now)
+            if not dates:
+                if latest > state.get(tenant_id, ""):
+                    state[tenant_id] = latest
+                continue
+            self.logger.info("[调度] 租户 %s 待提报 %d 天：%s", tenant_id, len(dates), ", ".join(dates))
+            try:
+                batch_result = self.mcp.dispatch_overtime_batch(dates=dates, tenant_id=tenant_id)
+            except Exception as e:
+                # 令牌过期、租户不存在等：本租户水位线不动，下次调度重试
+                self.logger.error("[调度] 租户 %s 提报失败：%s", tenant_id, e)
+                continue
+            results[tenant_id] = batch_result
+            first_day = datetime.strptime(dates[0], self.config.DATE_FORMAT) - timedelta(days=1)
+            watermark = state.get(tenant_id) or first_day.strftime(self.config.DATE_FORMAT)
+            for task_result in batch_result["results"]:
+                if task_result["task_status"] == "failed":
+                    break
+                watermark = task_result["overtime_date"]
+            else:
+                watermark = latest
+            state[tenant_id] = watermark
+        self._save_state(state)
+        return results
+
+    def next_run_at(self, now: datetime = None):
+        """下一次提报时间（之后 14 天内第一个工作日的提报时间），未配置工作日时返回 None"""
+        now = now or self.now()
+        for offset in range(15):
+            day = now.date() + timedelta(days=offset)
+            if self.is_workday(day) and self.trigger_time(day) > now:
+                return self.trigger_time(day)
+        return None
+
+    def run_forever(self):
+        """启动时先补报停机期间漏掉的日期，之后在每个工作日的提报时间执行一次规划"""
+        self.logger.info(
+            "[调度] 已启动：星期 %s，加班结束 %s 后 %s 分钟提报，租户：%s",
+            self.config.WORKDAYS, self.config.FIXED_OVERTIME_END,
+            self.config.SCHEDULE_OFFSET_MINUTES, ", ".join(self.tenant_ids()),
+        )
+        self._run_pass_safely()
+        while not self._stop.is_set():
+            next_run = self.next_run_at()
+            if next_run is None:
+                self.logger.warning("[调度] 未配置任何提报的星期，调度器空闲")
+                self._stop.wait(_MAX_WAIT_SECONDS)
+                continue
+            self.logger.info("[调度] 下次提报时间：%s", next_run.strftime("%Y-%m-%d %H:%M:%S"))
+            while not self._stop.is_set():
+                remaining = (next_run - self.now()).total_seconds()
+                if remaining <= 0:
+                    break
+                self._stop.wait(min(remaining, _MAX_WAIT_SECONDS))
+            if not self._stop.is_set():
+                self._run_pass_safely()
+
+    def _run_pass_safely(self):
+        # 单次规划异常不能让常驻调度线程退出
+        try:
+            self.run_pass()
+        except Exception as e:
+            self.logger.exception("[调度] 规划执行异常：%s", e)
+
+    def start(self):
+        """在后台线程运行（与 HTTP 服务同进程时使用）"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self.run_forever, name="mcp-scheduler", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def stop(self):
+        self._stop.set()
+
+
+def scheduler_enabled(config) -> bool:
+    return is_truthy(config.SCHEDULER)
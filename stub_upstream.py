@@ -0,0 +1,175 @@
+# stub_upstream.py - 本地上游 OA 桩服务：模拟 validExist / instance start / listJson 三个接口，供压测与联调使用
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+from datetime import datetime, timedelta
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class StubState:
+    """桩服务状态：延迟、错误率、日报行数等配置，以及已提报的加班时段与调用计数"""
+    def __init__(self, latency_ms: float = 0, jitter_ms: float = 0, error_rate: float = 0,
+                 rows: int = 120, last_date: str = None, token: str = None, seed: int = None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self.token = token
+        self.random = random.Random(seed)
+        last = datetime.strptime(last_date, "%Y-%m-%d") if last_date else datetime.now()
+        # 日报按日期倒序生成，每天一条
+        self.rows = [
+            {
+                "id_": str(index + 1),
+                "DATE_": (last - timedelta(days=index)).strftime("%Y-%m-%d"),
+                "content": f"桩日报内容 {index + 1}",
+            }
+            for index in range(rows)
+        ]
+        self.submitted = []
+        self.counters = {}
+        self.connections = set()
+        self._lock = threading.Lock()
+        self._inst_seq = 0
+
+    def count(self, endpoint: str, client: tuple):
+        with self._lock:
+            self.counters[endpoint] = self.counters.get(endpoint, 0) + 1
+            self.connections.add(client)
+
+    def sleep(self):
+        delay = self.latency_ms + self.random.uniform(-self.jitter_ms, self.jitter_ms)
+        if delay > 0:
+            time.sleep(delay / 1000)
+
+    def should_fail(self) -> bool:
+        return self.error_rate > 0 and self.random.random() < self.error_rate
+
+    def list_json(self, body: dict) -> dict:
+        query_filter = body.get("queryFilter") or {}
+        rows = self.rows
+        for query in query_filter.get("querys") or []:
+            if query.get("property") != "DATE_":
+                continue
+            value = query.get("value")
+            operation = query.get("operation")
+            if operation == "EQUAL":
+                rows = [r for r in rows if r["DATE_"] == value]
+            elif operation == "LESS_EQUAL":
+                rows = [r for r in rows if r["DATE_"] <= value]
+            elif operation == "GREAT_EQUAL":
+                rows = [r for r in rows if r["DATE_"] >= value]
+        for sorter in query_filter.get("sorter") or []:
+            if sorter.get("property") == "DATE_":
+                rows = sorted(rows, key=lambda r: r["DATE_"], reverse=sorter.get("direction") == "DESC")
+        page_bean = query_filter.get("pageBean") or {}
+        page = int(page_bean.get("page") or 1)
+        page_size = int(page_bean.get("pageSize") or 10)
+        return {
+            "rows": rows[(page - 1) * page_size: page * page_size],
+            "total": len(rows),
+            "page": page,
+            "pageSize": page_size,
+        }
+
+    def valid_exist(self, body: dict) -> dict:
+        start_time, end_time = body.get("startTime"), body.get("endTime")
+        with self._lock:
+            exists = any(s < end_time and e > start_time for s, e in self.submitted)
+        return {"state": True, "value": exists or None}
+
+    def start(self, body: dict) -> dict:
+        import base64
+        payload = json.loads(base64.b64decode(body.get("data") or "").decode("utf-8") or "{}")
+        record = payload.get("jbsqb") or {}
+        with self._lock:
+            self._inst_seq += 1
+            inst_id = f"STUB-{self._inst_seq}"
+            if record.get("START_TIME_") and record.get("END_TIME_"):
+                self.submitted.append((record["START_TIME_"], record["END_TIME_"]))
+        return {"state": True, "message": "流程启动成功(桩)", "instId": inst_id}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    routes = {
+        "/form/dataTemplate/v1/listJson": "list_json",
+        "/mis/hf/common/v1/validExist": "valid_exist",
+        "/runtime/instance/v1/start": "start",
+    }
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, payload: dict = None):
+        data = json.dumps(payload or {}, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        state = self.server.state
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        route = next((name for path, name in self.routes.items() if self.path.endswith(path)), None)
+        if route is None:
+            self._reply(404, {"message": "not found"})
+            return
+        state.count(route, self.client_address)
+        state.sleep()
+        if state.token and self.headers.get("Authorization") != f"Bearer {state.token}":
+            self._reply(401, {"message": "token expired"})
+            return
+        if state.should_fail():
+            self._reply(500, {"message": "stub injected error"})
+            return
+        try:
+            body = json.loads(raw or b"{}")
+        except ValueError:
+            self._reply(400, {"message": "bad json"})
+            return
+        self._reply(200, getattr(state, route)(body))
+
+
+def start_stub(host: str = "127.0.0.1", port: int = 0, **options):
+    """
+    在后台线程启动桩服务
+    :return: (server, base_url)，server.state 可读取调用计数，结束时调用 server.shutdown()
+    """
+    server = ThreadingHTTPServer((host, port), StubHandler)
+    server.daemon_threads = True
+    server.state = StubState(**options)
+    threading.Thread(target=server.serve_forever, name="stub-upstream", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地上游 OA 桩服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=18080)
+    parser.add_argument("--latency-ms", type=float, default=0, help="每个请求的基础延迟（毫秒）")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="延迟抖动范围（毫秒）")
+    parser.add_argument("--error-rate", type=float, default=0, help="返回 500 的概率（0~1）")
+    parser.add_argument("--rows", type=int, default=120, help="日报行数（每天一条，按日期倒序）")
+    parser.add_argument("--last-date", default=None, help="最新一条日报的日期，默认今天")
+    parser.add_argument("--token", default=None, help="设置后只接受该 token，其余返回 401")
+    args = parser.parse_args()
+    server, base_url = start_stub(
+        args.host, args.port,
+        latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, error_rate=args.error_rate,
+        rows=args.rows, last_date=args.last_date, token=args.token,
+    )
+    sys.stderr.write(f"桩服务已启动：{base_url}\n")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+# tenants.py - 多用户（租户）档案：每个员工的令牌、身份字段与项目信息，一个 MCP 进程服务整个团队
+import os
+import re
+import json
+
+DEFAULT_TENANT_ID = "default"
+
+# 档案字段 -> 默认值所在的全局配置项
+_PROFILE_FIELDS = {
+    "token": "API_TOKEN",
+    "user_id": "USER_ID",
+    "employee_name": "EMPLOYEE_NAME",
+    "dept_id": "DEPT_ID",
+    "dept_name": "DEPT_NAME",
+    "def_id": "FLOW_DEF_ID",
+    "project_name": "PROJECT_NAME",
+    "project_id": "PROJECT_ID",
+}
+
+
+class TenantProfile:
+    """
+    单个租户（员工）的档案，未配置的字段沿用全局配置
+    令牌除外：非默认租户必须配置自己的 token，否则会以默认员工的身份替他人提报
+    :raises ValueError: 非默认租户缺少 token
+    """
+    def __init__(self, tenant_id: str, config, **fields):
+        self.tenant_id = tenant_id
+        if tenant_id != DEFAULT_TENANT_ID and fields.get("token") in (None, ""):
+            raise ValueError(f"租户 {tenant_id} 未配置 token")
+        for field, config_key in _PROFILE_FIELDS.items():
+            value = fields.get(field)
+            setattr(self, field, value if value not in (None, "") else getattr(config, config_key))
+        # HTTP 传输的访问密钥（Authorization: Bearer）：同样不沿用默认租户的配置
+        secret = fields.get("http_secret")
+        if tenant_id == DEFAULT_TENANT_ID and not secret:
+            secret = getattr(config, "HTTP_SECRET", None)
+        self.http_secret = secret or None
+
+    @property
+    def storage_suffix(self) -> str:
+        """本地文件名后缀（台账等按租户隔离），默认租户为空以兼容原有文件"""
+        if self.tenant_id == DEFAULT_TENANT_ID:
+            return ""
+        return "_" + re.sub(r"[^0-9A-Za-z_.-]", "_", self.tenant_id)
+
+    def __repr__(self):
+        return f"TenantProfile({self.tenant_id!r}, user_id={self.user_id!r}, employee_name={self.employee_name!r})"
+
+
+def load_tenant_profiles(config) -> dict:
+    """
+    加载租户档案：默认租户来自全局配置，其余来自 TENANTS_FILE（JSON）
+    文件格式为 {"租户ID": {"token": ..., "user_id": ..., ...}} 或带 tenant_id 字段的列表
+    :raises ValueError: 档案文件格式错误，或非默认租户缺少 token
+    """
+    profiles = {DEFAULT_TENANT_ID: TenantProfile(DEFAULT_TENANT_ID, config)}
+    path = getattr(config, "TENANTS_FILE", None)
+    if not path or not os.path.exists(path):
+        return profiles
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if isinstance(data, list):
+        data = {item.get("tenant_id"): item for item in data}
+    if not isinstance(data, dict):
+        raise ValueError(f"租户档案文件格式错误：{path}")
+    for tenant_id, fields in data.items():
+        if not tenant_id or not isinstance(fields, dict):
+            raise ValueError(f"租户档案文件格式错误：{path}")
+        fields = {k: v for k, v in fields.items() if k in _PROFILE_FIELDS or k == "http_secret"}
+        profiles[str(tenant_id)] = TenantProfile(str(tenant_id), config, **fields)
+    return profiles
@@ -4,6 +4,64 @@ import json
 import time
 import subprocess
 
+def check_prefetch_partial_failure():
+    """
+    回归检查：区间预查中途失败时，已查过的日期不能留下覆盖标记，
+    否则 execute 会信任本地索引跳过 validExist，对已存在记录的日期重复提报
+    """
+    os.environ.setdefault("OVERTIME_API_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("OVERTIME_API_TOKEN", "dummy")
+    os.environ["MCP_SIMULATE"] = "1"
+    from overtime_task import OvertimeSubmitTask
+
+    task = OvertimeSubmitTask()
+    calls = []
+
+    def valid_exist(start_time, end_time):
+        calls.append((start_time, end_time))
+        if start_time.startswith("2026-01-06"):
+            raise OSError("connection reset by peer")
+        return {"state": True, "value": True}
+
+    task._request_valid_exist = valid_exist
+    task.prefetch_existing(["2026-01-05", "2026-01-06"])
+    calls.clear()
+    result = task.execute("2026-01-05", "预查失败回归检查")
+    task.close()
+    print("prefetch partial failure:", json.dumps(result, ensure_ascii=False))
+    return bool(calls) and result.get("task_status") == "skipped"
+
+def check_force_resubmit():
+    """
+    回归检查：台账中已成功的日期被驳回或撤回后，force=True 时经 validExist 确认后重新提报，
+    不传 force 时仍在本地跳过
+    """
+    os.environ.setdefault("OVERTIME_API_URL", "http://127.0.0.1:9")
+    os.environ.setdefault("OVERTIME_API_TOKEN", "dummy")
+    os.environ["MCP_SIMULATE"] = "1"
+    from overtime_task import OvertimeSubmitTask
+
+    task = OvertimeSubmitTask()
+    first = task.execute("2026-01-08", "驳回后重新提报回归检查")
+    calls = []
+
+    def valid_exist(start_time, end_time):
+        # 审批驳回后上游不再有未完成的记录
+        calls.append((start_time, end_time))
+        return {"state": True, "value": None}
+
+    task._request_valid_exist = valid_exist
+    again = task.execute("2026-01-08", "驳回后重新提报回归检查")
+    forced = task.execute("2026-01-08", "驳回后重新提报回归检查", force=True)
+    task.close()
+    print("force resubmit:", json.dumps(forced, ensure_ascii=False))
+    return (
+        first.get("task_status") == "success"
+        and again.get("task_status") == "skipped"
+        and forced.get("task_status") == "success"
+        and len(calls) == 1
+    )
+
 def run():
     env = os.environ.copy()
     env["JABANMCP_MODE"] = "mcp"
@@ -17,6 +75,7 @@ def run():
         stderr=subprocess.PIPE,
         text=True,
         bufsize=1,
+        env=env,
     )
 
     def send_recv(msg, timeout=5):
@@ -69,7 +128,9 @@ def run():
         submit_ok = submit_json.get("task_status") == "success"
     except Exception:
         submit_ok = False
-    print("CONCLUSION:", "TEST PASSED" if (init_ok and tools_ok and submit_ok) else "TEST FAILED")
+    prefetch_ok = check_prefetch_partial_failure()
+    force_ok = check_force_resubmit()
+    print("CONCLUSION:", "TEST PASSED" if (init_ok and tools_ok and submit_ok and prefetch_ok and force_ok) else "TEST FAILED")
 
     try:
         proc.terminate()
@@ -0,0 +1,280 @@
+# transport.py - 上游传输层：OvertimeSubmitTask 的所有上游请求都经由这里发出
+# live 真实 HTTP；fake 进程内仿真 OA（原 MCP_SIMULATE）；record / replay 录制与回放（cassette 文件）
+import os
+import json
+import time
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+from upstream import build_session, is_truthy, pool_capacity
+
+# 传输后端
+UPSTREAM_LIVE = "live"
+UPSTREAM_FAKE = "fake"
+UPSTREAM_RECORD = "record"
+UPSTREAM_REPLAY = "replay"
+
+
+class UpstreamHTTPError(OSError):
+    """非 live 后端返回的 HTTP 错误，与 requests.HTTPError 一样携带 response（供重试与台账判断）"""
+    def __init__(self, message: str, response=None):
+        super().__init__(message)
+        self.response = response
+
+
+class CassetteMissError(LookupError):
+    """回放模式下 cassette 中没有与请求匹配的录制记录"""
+    pass
+
+
+class TransportResponse:
+    """非 live 后端的响应对象，只实现任务层用到的 requests.Response 接口"""
+    def __init__(self, status_code: int, payload=None):
+        self.status_code = status_code
+        self._payload = payload
+
+    @property
+    def text(self) -> str:
+        return json.dumps(self._payload, ensure_ascii=False)
+
+    def json(self):
+        if self._payload is None:
+            raise ValueError("响应体为空")
+        return self._payload
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise UpstreamHTTPError(f"{self.status_code} Error", response=self)
+
+
+def _endpoint(url: str) -> str:
+    return url.rsplit("/", 1)[-1]
+
+
+def _response_payload(response):
+    try:
+        return response.json()
+    except ValueError:
+        return None
+
+
+class LiveTransport:
+    """真实上游：带连接池的长连接会话"""
+    name = UPSTREAM_LIVE
+
+    def __init__(self, session, pool_size: int = None):
+        self.session = session
+        # 连接池满时排队的名额：拿到连接之后才开始计时，排队时间不算作上游延迟
+        self._slots = threading.BoundedSemaphore(pool_size) if pool_size else None
+
+    def post(self, url: str, body: dict, timeout):
+        """
+        发出请求；响应的 sent_at 为拿到连接后的发出时刻（time.monotonic），供限流器计算上游延迟
+        """
+        if self._slots is None:
+            sent_at = time.monotonic()
+            response = self.session.post(url=url, json=body, timeout=timeout)
+        else:
+            with self._slots:
+                sent_at = time.monotonic()
+                response = self.session.post(url=url, json=body, timeout=timeout)
+        response.sent_at = sent_at
+        return response
+
+    def update_headers(self, headers: dict):
+        self.session.headers.update(headers)
+
+    def close(self):
+        self.session.close()
+
+
+class FakeTransport:
+    """
+    进程内仿真 OA：每天都有一条日报，validExist 按本进程已发起的流程判断重叠，start 返回递增的实例 ID
+    不走网络，结果确定，任务层的完整请求链路（重试、熔断、缓存、台账、指标）照常执行
+    """
+    name = UPSTREAM_FAKE
+    # listJson 未指定下界时最多回溯的天数
+    _MAX_DAYS = 366
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._submitted = []
+        self._inst_seq = 0
+
+    def post(self, url: str, body: dict, timeout):
+        handler = {
+            "listJson": self._list_json,
+            "validExist": self._valid_exist,
+            "start": self._start,
+        }.get(_endpoint(url))
+        if handler is None:
+            return TransportResponse(404, {"message": "not found"})
+        return TransportResponse(200, handler(body or {}))
+
+    def _list_json(self, body: dict) -> dict:
+        query_filter = body.get("queryFilter") or {}
+        upper = datetime.now().date()
+        lower = None
+        for query in query_filter.get("querys") or []:
+            if query.get("property") != "DATE_":
+                continue
+            value = datetime.strptime(query.get("value"), "%Y-%m-%d").date()
+            operation = query.get("operation")
+            if operation in ("LESS_EQUAL", "EQUAL"):
+                upper = min(upper, value) if operation == "LESS_EQUAL" else value
+            if operation in ("GREAT_EQUAL", "EQUAL"):
+                lower = value
+        lower = lower or upper - timedelta(days=self._MAX_DAYS - 1)
+        total = max(0, (upper - lower).days + 1)
+        page_bean = query_filter.get("pageBean") or {}
+        page = int(page_bean.get("page") or 1)
+        page_size = int(page_bean.get("pageSize") or 10)
+        rows = []
+        # 按日期倒序分页，只生成当前页
+        for index in range((page - 1) * page_size, min(page * page_size, total)):
+            date = (upper - timedelta(days=index)).strftime("%Y-%m-%d")
+            rows.append({"id_": date.replace("-", ""), "DATE_": date, "content": f"{date} 仿真日报内容"})
+        return {"rows": rows, "total": total, "page": page, "pageSize": page_size}
+
+    def _valid_exist(self, body: dict) -> dict:
+        start_time, end_time = body.get("startTime"), body.get("endTime")
+        with self._lock:
+            exists = any(s < end_time and e > start_time for s, e in self._submitted)
+        return {"state": True, "value": exists or None}
+
+    def _start(self, body: dict) -> dict:
+        import base64
+        payload = json.loads(base64.b64decode(body.get("data") or "").decode("utf-8") or "{}")
+        record = payload.get("jbsqb") or {}
+        with self._lock:
+            self._inst_seq += 1
+            inst_id = f"SIM-{self._inst_seq}"
+            if record.get("START_TIME_") and record.get("END_TIME_"):
+                self._submitted.append((record["START_TIME_"], record["END_TIME_"]))
+        return {"state": True, "message": "流程启动成功(仿真)", "instId": inst_id}
+
+    def update_headers(self, headers: dict):
+        pass
+
+    def close(self):
+        pass
+
+
+# 同一 cassette 文件的写入串行化（多个租户或线程同时录制）
+_CASSETTE_LOCKS = {}
+_CASSETTE_LOCKS_GUARD = threading.Lock()
+
+
+def _cassette_lock(path: str) -> threading.Lock:
+    with _CASSETTE_LOCKS_GUARD:
+        return _CASSETTE_LOCKS.setdefault(os.path.abspath(path), threading.Lock())
+
+
+class CassetteTransport:
+    """
+    录制 / 回放：record 模式把内层传输的每次请求与响应追加写入 cassette（JSONL，不含请求头与令牌）；
+    replay 模式完全不走网络，按（接口, 请求体）匹配录制记录，同一请求多次出现时按录制顺序返回；
+    请求体含时间戳等易变字段匹配不上时，退回到同一接口下一条未使用的记录
+    """
+    def __init__(self, path: str, inner=None):
+        self.path = path
+        self.inner = inner
+        self.name = UPSTREAM_RECORD if inner is not None else UPSTREAM_REPLAY
+        self._lock = threading.Lock()
+        self._by_request = {}
+        self._by_endpoint = {}
+        if inner is None:
+            self._load()
+
+    @staticmethod
+    def _request_key(endpoint: str, body: dict) -> str:
+        return endpoint + " " + json.dumps(body, ensure_ascii=False, sort_keys=True)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            raise FileNotFoundError(f"cassette 文件不存在：{self.path}")
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                interaction = json.loads(line)
+                entry = {"interaction": interaction, "used": False}
+                key = self._request_key(interaction["endpoint"], interaction.get("request"))
+                self._by_request.setdefault(key, deque()).append(entry)
+                self._by_endpoint.setdefault(interaction["endpoint"], deque()).append(entry)
+
+    def _take(self, queue_: deque):
+        while queue_:
+            entry = queue_.popleft()
+            if not entry["used"]:
+                entry["used"] = True
+                return entry["interaction"]
+        return None
+
+    def post(self, url: str, body: dict, timeout):
+        endpoint = _endpoint(url)
+        if self.inner is not None:
+            response = self.inner.post(url, body, timeout)
+            self._append({
+                "endpoint": endpoint,
+                "request": body,
+                "status": response.status_code,
+                "response": _response_payload(response),
+            })
+            return response
+        with self._lock:
+            interaction = self._take(self._by_request.get(self._request_key(endpoint, body), deque()))
+            if interaction is None:
+                interaction = self._take(self._by_endpoint.get(endpoint, deque()))
+        if interaction is None:
+            raise CassetteMissError(f"cassette 中没有可回放的 {endpoint} 请求：{self.path}")
+        return TransportResponse(interaction["status"], interaction.get("response"))
+
+    def _append(self, interaction: dict):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        line = json.dumps(interaction, ensure_ascii=False)
+        with _cassette_lock(self.path):
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def update_headers(self, headers: dict):
+        if self.inner is not None:
+            self.inner.update_headers(headers)
+
+    def close(self):
+        if self.inner is not None:
+            self.inner.close()
+
+
+def upstream_backend(config) -> str:
+    """当前配置的传输后端；MCP_SIMULATE=1 等价于 fake（兼容原有仿真模式）"""
+    if is_truthy(getattr(config, "SIMULATE", "0")):
+        return UPSTREAM_FAKE
+    return (getattr(config, "UPSTREAM", UPSTREAM_LIVE) or UPSTREAM_LIVE).strip().lower()
+
+
+def build_transport(config, headers: dict, cassette_path: str = None):
+    """
+    按配置构建传输后端
+    :param cassette_path: record / replay 使用的 cassette 文件（按租户区分）
+    :return: 传输对象；live / record 模式下 requests 未安装时返回 None
+    :raises ValueError: 未知的后端名称
+    """
+    backend = upstream_backend(config)
+    if backend == UPSTREAM_FAKE:
+        return FakeTransport()
+    if backend == UPSTREAM_REPLAY:
+        return CassetteTransport(cassette_path)
+    if backend not in (UPSTREAM_LIVE, UPSTREAM_RECORD):
+        raise ValueError(f"未知的上游传输后端：{backend}（可选 live / fake / record / replay）")
+    session = build_session(config, headers)
+    if session is None:
+        return None
+    live = LiveTransport(session, pool_capacity(config) if is_truthy(config.POOL_BLOCK) else None)
+    if backend == UPSTREAM_RECORD:
+        return CassetteTransport(cassette_path, inner=live)
+    return live
@@ -0,0 +1,53 @@
+# upstream.py - 上游 OA 接口连接层：连接池会话与超时配置，供 OvertimeSubmitTask 复用
+import math
+
+
+def _load_requests():
+    """按需导入 requests：冷启动阶段不付出导入开销，首次建立会话时才加载"""
+    try:
+        import requests
+        from requests.adapters import HTTPAdapter
+    except Exception:
+        return None, None
+    return requests, HTTPAdapter
+
+
+def is_truthy(value) -> bool:
+    return str(value).strip().lower() in ("1", "true", "yes", "on")
+
+
+def build_timeout(config):
+    """连接超时与读取超时分开配置：连不上尽快失败，慢响应仍按读取超时等待"""
+    return (float(config.CONNECT_TIMEOUT), float(config.READ_TIMEOUT))
+
+
+def pool_capacity(config) -> int:
+    """
+    连接池大小：开启自适应限流时按并发上限的增长上界扩容，
+    否则限流器放行的请求会在连接池里排队，并发上限实际被 MCP_POOL_SIZE 封顶（连接按需建立，空闲时不多占）
+    """
+    pool_size = max(1, int(config.POOL_SIZE))
+    if is_truthy(config.RATE_LIMIT):
+        pool_size = max(pool_size, int(math.ceil(float(config.RATE_LIMIT_MAX))))
+    return pool_size
+
+
+def build_session(config, headers: dict):
+    """构建带连接池的长连接会话，进程内跨工具调用复用 TCP/TLS 连接"""
+    requests, HTTPAdapter = _load_requests()
+    if requests is None:
+        return None
+    pool_size = pool_capacity(config)
+    session = requests.Session()
+    # pool_block=True 时并发请求排队等待空闲的热连接，而不是临时新建连接再丢弃
+    adapter = HTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        pool_block=is_truthy(config.POOL_BLOCK),
+        max_retries=0,
+    )
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers.update(headers)
+    session.headers["Connection"] = "keep-alive" if is_truthy(config.HTTP_KEEP_ALIVE) else "close"
+    return session
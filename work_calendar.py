@@ -0,0 +1,149 @@
+# work_calendar.py - 工作日历：按星期规则与本地节假日数据文件判断某天是否需要提报加班
+import os
+import json
+import threading
+from datetime import date, datetime, timedelta
+
+# 日期类型：普通工作日、周末（按星期规则休息）、法定节假日、调休上班日
+DAY_WORKDAY = "workday"
+DAY_WEEKEND = "weekend"
+DAY_HOLIDAY = "holiday"
+DAY_MAKEUP_WORKDAY = "makeup_workday"
+WORKING_DAY_TYPES = (DAY_WORKDAY, DAY_MAKEUP_WORKDAY)
+DAY_TYPE_LABELS = {
+    DAY_WORKDAY: "工作日",
+    DAY_WEEKEND: "休息日",
+    DAY_HOLIDAY: "法定节假日",
+    DAY_MAKEUP_WORKDAY: "调休上班日",
+}
+
+
+def parse_workdays(value: str) -> set:
+    """解析工作的星期：'1,2,3,4,5' -> {1, 2, 3, 4, 5}（ISO 星期，1=周一）"""
+    workdays = set()
+    for part in str(value or "").split(","):
+        part = part.strip()
+        if not part:
+            continue
+        day = int(part)
+        if not 1 <= day <= 7:
+            raise ValueError(f"工作日配置中的星期超出范围：{part}")
+        workdays.add(day)
+    return workdays
+
+
+def _to_date(day) -> date:
+    if isinstance(day, datetime):
+        return day.date()
+    if isinstance(day, date):
+        return day
+    try:
+        return date.fromisoformat(day)
+    except ValueError:
+        # 兼容未补零的写法（如 2026-1-7），与 DATE_FORMAT 的校验规则一致
+        return datetime.strptime(day, "%Y-%m-%d").date()
+
+
+class WorkCalendar:
+    """
+    工作日历：节假日与调休上班日在加载时展开为按日期索引的字典，每个日期的判断为 O(1)
+    数据文件未覆盖的日期按星期规则判断
+    """
+    def __init__(self, holidays: dict = None, makeup_workdays: dict = None, weekdays: set = None):
+        # 日期字符串 -> (日期类型, 名称)
+        self._index = {}
+        for day, name in (holidays or {}).items():
+            self._index[day] = (DAY_HOLIDAY, name)
+        for day, name in (makeup_workdays or {}).items():
+            self._index[day] = (DAY_MAKEUP_WORKDAY, name)
+        self.weekdays = set(weekdays) if weekdays is not None else {1, 2, 3, 4, 5}
+
+    def classify(self, day) -> tuple:
+        """
+        判断日期类型
+        :param day: 日期（YYYY-MM-DD 字符串、date 或 datetime）
+        :return: (日期类型, 节假日或调休名称；普通工作日与周末为 None)
+        """
+        found = self._index.get(day) if isinstance(day, str) else None
+        if found is not None:
+            return found
+        day = _to_date(day)
+        found = self._index.get(day.isoformat())
+        if found is not None:
+            return found
+        if day.isoweekday() in self.weekdays:
+            return DAY_WORKDAY, None
+        return DAY_WEEKEND, None
+
+    def is_workday(self, day) -> bool:
+        return self.classify(day)[0] in WORKING_DAY_TYPES
+
+    def describe(self, day) -> str:
+        """日期类型的中文说明，如「法定节假日（春节）」"""
+        day_type, name = self.classify(day)
+        label = DAY_TYPE_LABELS[day_type]
+        return f"{label}（{name}）" if name else label
+
+    def __len__(self):
+        return len(self._index)
+
+
+def _expand_entries(entries: list, path: str) -> dict:
+    """把 [{"name", "date"} 或 {"name", "start", "end"}] 展开为 日期 -> 名称"""
+    expanded = {}
+    for entry in entries or []:
+        name = entry.get("name")
+        start = entry.get("start") or entry.get("date")
+        end = entry.get("end") or start
+        if not start:
+            raise ValueError(f"工作日历 {path} 中的条目缺少日期：{entry}")
+        day, last = date.fromisoformat(start), date.fromisoformat(end)
+        while day <= last:
+            expanded[day.isoformat()] = name
+            day += timedelta(days=1)
+    return expanded
+
+
+def load_work_calendar(path: str, weekdays: set = None) -> WorkCalendar:
+    """
+    从本地数据文件加载工作日历，文件不存在时只按星期规则判断
+    文件格式：{"holidays": [{"name": "春节", "start": "2026-02-15", "end": "2026-02-23"}],
+              "workdays": [{"name": "春节调休", "date": "2026-02-14"}]}
+    :raises ValueError: 文件内容格式错误
+    """
+    if not path or not os.path.exists(path):
+        return WorkCalendar(weekdays=weekdays)
+    with open(path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    if not isinstance(data, dict):
+        raise ValueError(f"工作日历 {path} 必须是 JSON 对象")
+    return WorkCalendar(
+        _expand_entries(data.get("holidays"), path),
+        _expand_entries(data.get("workdays"), path),
+        weekdays,
+    )
+
+
+# 按（文件, 修改时间, 星期规则）缓存已加载的日历：数据文件或配置变化后下一次取用时自动重新加载
+_CALENDARS = {}
+_CALENDARS_LOCK = threading.Lock()
+
+
+def get_work_calendar(config) -> WorkCalendar:
+    """取当前配置（CALENDAR_FILE、WORKDAYS）对应的工作日历（进程内共享），提报与常驻调度共用"""
+    path = config.CALENDAR_FILE
+    workdays = config.WORKDAYS
+    try:
+        mtime = os.stat(path).st_mtime_ns if path else None
+    except OSError:
+        mtime = None
+    key = (path, mtime, workdays)
+    with _CALENDARS_LOCK:
+        calendar = _CALENDARS.get(key)
+        if calendar is None:
+            calendar = load_work_calendar(path, parse_workdays(workdays))
+            # 只保留最新版本，旧的数据文件版本不再需要
+            for old_key in [k for k in _CALENDARS if k[0] == path and k[2] == workdays]:
+                del _CALENDARS[old_key]
+            _CALENDARS[key] = calendar
+        return calendar